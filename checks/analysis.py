@@ -0,0 +1,179 @@
+"""
+Shared analysis of a schedule, for use by the checks.
+
+An `AnalysisContext` parses a schedule at most once and lazily computes views
+of it which several checks need, so that running many checks over the same
+schedule doesn't repeat that work. Checks take a context and return a
+structured result, which knows how to render itself as text.
+"""
+
+from __future__ import annotations
+
+import math
+import functools
+import itertools
+from typing import Protocol, NamedTuple
+from pathlib import Path
+from collections.abc import Iterable, Iterator, Sequence
+
+import numpy as np
+import helpers
+import numpy.typing as npt
+from helpers import Team
+
+# Larger matches are split into games of this many teams when working out who
+# faces whom.
+TEAMS_PER_GAME = 4
+
+
+class CheckResult(Protocol):
+    def render(self) -> str:
+        """
+        Render the result as text, as the check prints it.
+        """
+        ...
+
+    def metrics(self) -> dict[str, object]:
+        """
+        The key measures from the result, as JSON-compatible values.
+        """
+        ...
+
+
+class _GamePairs(NamedTuple):
+    game_ids: npt.NDArray[np.int64]
+    faces_position: int
+    team: npt.NDArray[np.int64]
+    faces: npt.NDArray[np.int64]
+
+
+class FacingMatrix:
+    """
+    How many times each team faces each other team within a game, as a matrix
+    indexed by interned team id. Teams are not counted as facing themselves.
+    """
+
+    def __init__(self, teams: Sequence[Team], games: npt.NDArray[np.int64]) -> None:
+        self.teams = tuple(teams)
+        # One row per game, of interned team ids padded with EMPTY
+        self.games = games
+        self.counts = self._count(len(self.teams), games)
+
+    @classmethod
+    def build(cls, interned: helpers.InternedSchedule) -> FacingMatrix:
+        num_matches = len(interned)
+        width = math.ceil(interned.width / TEAMS_PER_GAME) * TEAMS_PER_GAME
+
+        # Split each match into games, in the same way as when counting by hand
+        matches = np.full((num_matches, width), interned.EMPTY, dtype=np.int64)
+        matches[:, :interned.width] = np.asarray(interned.data, dtype=np.int64).reshape(
+            num_matches,
+            interned.width,
+        )
+        games = matches.reshape(-1, TEAMS_PER_GAME)
+        games = games[(games != interned.EMPTY).any(axis=1)]
+
+        return cls(interned.teams, games)
+
+    @staticmethod
+    def _count(num_teams: int, games: npt.NDArray[np.int64]) -> npt.NDArray[np.int64]:
+        # Accumulate the pairs of teams in each game. This avoids an integer
+        # matrix product of the team x game incidence matrix, which NumPy
+        # doesn't hand off to BLAS and so is far slower.
+        flat = np.zeros(num_teams * num_teams, dtype=np.int64)
+        for pairs in FacingMatrix._pairs(games):
+            flat += np.bincount(
+                pairs.team * num_teams + pairs.faces,
+                minlength=num_teams * num_teams,
+            )
+        counts = flat.reshape(num_teams, num_teams)
+
+        np.fill_diagonal(counts, 0)
+        return counts
+
+    @staticmethod
+    def _pairs(games: npt.NDArray[np.int64]) -> Iterator[_GamePairs]:
+        """
+        Yield the teams in each game along with the teams they face in it, one
+        pair of positions within the games at a time.
+        """
+        empty = helpers.InternedSchedule.EMPTY
+        game_ids = np.arange(len(games), dtype=np.int64)
+        for position, faces_position in itertools.product(range(games.shape[1]), repeat=2):
+            team = games[:, position]
+            faces = games[:, faces_position]
+            valid = (team != empty) & (faces != empty)
+            yield _GamePairs(game_ids[valid], faces_position, team[valid], faces[valid])
+
+    @property
+    def num_games(self) -> int:
+        return len(self.games)
+
+    @functools.cached_property
+    def first_faced(self) -> npt.NDArray[np.int64]:
+        """
+        A key for when each team first faced each other team, which orders
+        opponents as they are met: by game and then position within it.
+        """
+        num_teams = len(self.teams)
+        width = self.games.shape[1]
+        first = np.full((num_teams, num_teams), np.iinfo(np.int64).max, dtype=np.int64)
+
+        for pairs in self._pairs(self.games):
+            np.minimum.at(
+                first,
+                (pairs.team, pairs.faces),
+                pairs.game_ids * width + pairs.faces_position,
+            )
+
+        return first
+
+
+class AnalysisContext:
+    """
+    With `stream` (the default) checks which only need a single pass over the
+    schedule read it from the file as they go, holding little of it in memory.
+    Without, every check works from the one shared interned schedule, so that
+    the schedule is only parsed once however many checks use the context.
+    """
+
+    def __init__(
+        self,
+        schedule_file: Path,
+        *,
+        use_mmap: bool = False,
+        stream: bool = True,
+    ) -> None:
+        self.schedule_file = schedule_file
+        self.use_mmap = use_mmap
+        self.stream = stream
+
+    def iter_schedule(self) -> Iterable[Sequence[Team]]:
+        """
+        The matches of the schedule, for checks which only need a single pass
+        over them.
+        """
+        if not self.stream:
+            interned = self.interned
+            return (interned.names(x) for x in interned)
+        return helpers.iter_schedule(self.schedule_file, use_mmap=self.use_mmap)
+
+    @functools.cached_property
+    def interned(self) -> helpers.InternedSchedule:
+        return helpers.load_interned_schedule(self.schedule_file)
+
+    @functools.cached_property
+    def appearances(self) -> dict[Team, list[int]]:
+        """
+        The (zero-based) numbers of the matches each team appears in, in order
+        of each team's first appearance.
+        """
+        interned = self.interned
+        return {
+            team: list(interned.appearances[team_id])
+            for team_id, team in enumerate(interned.teams)
+        }
+
+    @functools.cached_property
+    def facings(self) -> FacingMatrix:
+        return FacingMatrix.build(self.interned)
@@ -2,19 +2,33 @@
 
 from __future__ import annotations
 
+import io
+import os
+import sys
+import json
+import math
+import time
 import random
+import signal
 import argparse
 import functools
 import itertools
 import collections
 import dataclasses
-from typing import TypeVar, Callable, Protocol, DefaultDict
+import multiprocessing
+import concurrent.futures
+import multiprocessing.synchronize
+from typing import Tuple, TypeVar, Callable, Optional, Protocol, DefaultDict
 from pathlib import Path
-from collections.abc import Iterable, Iterator, Sequence
+from collections.abc import Mapping, Iterable, Iterator, Sequence
+from multiprocessing.sharedctypes import Synchronized, SynchronizedArray
 
 import tqdm
+import numpy as np
 import helpers
+import numpy.typing as npt
 from helpers import Team, Schedule
+from analysis import AnalysisContext
 
 T = TypeVar('T')
 
@@ -22,6 +36,25 @@ WARN_MIN_GAP = 2
 NO_PERMUTE = 'none'
 NO_PERMUTE_ADJUSTER = 'none'
 
+DEFAULT_INITIAL_TEMPERATURE = 1.0
+DEFAULT_FINAL_TEMPERATURE = 0.001
+DEFAULT_ANNEAL_ITERATIONS = 1_000_000
+# Longest run of matches which a single annealing move will rearrange
+ANNEAL_MAX_SEGMENT = 10
+# Incrementally maintained scores drift slightly, so ignore improvements
+# smaller than this to avoid reporting the same schedule as better.
+SCORE_TOLERANCE = 1e-9
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CHECKPOINT_INTERVAL = 60.0
+DEFAULT_WINDOW_OVERLAP = 4
+DEFAULT_WINDOW_ITERATIONS = 10_000
+DEFAULT_RESTART_INTERVAL = 100_000
+# How often (in seconds) parallel workers check whether they should stop
+WORKER_STOP_CHECK_INTERVAL = 0.1
+# How often (in seconds) the parent process reports on the parallel workers
+WORKER_POLL_INTERVAL = 0.5
+
 
 @dataclasses.dataclass(frozen=True)
 class TeamBreaks:
@@ -65,9 +98,13 @@ def compute_breaks(schedule: Schedule) -> list[TeamBreaks]:
         for tla in teams:
             matches[tla].append(match_num)
 
+    return breaks_from_appearances(matches)
+
+
+def breaks_from_appearances(appearances: Mapping[Team, Sequence[int]]) -> list[TeamBreaks]:
     min_breaks = []
 
-    for tla, team_matches in matches.items():
+    for tla, team_matches in appearances.items():
         breaks = []
         for last_match, match in pairwise(team_matches):
             diff = match - last_match
@@ -78,7 +115,50 @@ def compute_breaks(schedule: Schedule) -> list[TeamBreaks]:
     return min_breaks
 
 
-def _score(team_breaks: TeamBreaks) -> float:
+@dataclasses.dataclass(frozen=True)
+class ClosenessResult:
+    min_breaks: list[TeamBreaks]
+
+    @property
+    def num_warned(self) -> int:
+        return sum(1 for x in self.min_breaks if x.min_break == WARN_MIN_GAP)
+
+    def render(self) -> str:
+        out = io.StringIO()
+
+        print('Team\tMin-gap\tCount\tGaps', file=out)
+
+        for team_breaks in sorted(self.min_breaks, key=_sort_key):
+            print("\t".join(str(x) for x in (
+                team_breaks.tla,
+                team_breaks.min_break,
+                team_breaks.min_break_count,
+                team_breaks.breaks,
+            )), file=out)
+
+        print(file=out)
+        print(f"{self.num_warned} teams have a minimum gap of {WARN_MIN_GAP}", file=out)
+
+        return out.getvalue()
+
+    def metrics(self) -> dict[str, object]:
+        return {
+            # Teams with only one appearance have no gaps
+            'min_gaps': {
+                x.tla: x.min_break if x.breaks else None
+                for x in self.min_breaks
+            },
+            'min_gap_counts': {x.tla: x.min_break_count for x in self.min_breaks},
+            'warn_min_gap': WARN_MIN_GAP,
+            'num_teams_at_warn_min_gap': self.num_warned,
+        }
+
+
+def analyse(context: AnalysisContext) -> ClosenessResult:
+    return ClosenessResult(breaks_from_appearances(context.appearances))
+
+
+def _score_breaks(breaks: Iterable[int]) -> float:
     counts: collections.Counter[int] = collections.Counter()
 
     def gap_cost(gap: int) -> float:
@@ -87,145 +167,1138 @@ def _score(team_breaks: TeamBreaks) -> float:
         counts[gap] += 1
         return counts[gap] / gap
 
-    return sum(gap_cost(x) for x in team_breaks.breaks)
+    return sum(gap_cost(x) for x in breaks)
+
+
+def _score(team_breaks: TeamBreaks) -> float:
+    return _score_breaks(team_breaks.breaks)
 
 
 def _score_many(min_breaks: list[TeamBreaks]) -> float:
     return sum(_score(x) for x in min_breaks)
 
 
-def _random_permute(schedule: Schedule) -> Iterator[Schedule]:
-    while True:
-        out = list(schedule)
-        random.shuffle(out)
-        yield out
+class BreaksIndex(helpers.GapIndex):
+    """
+    A schedule along with an index of where each team appears in it, which
+    allows matches to be moved around while only re-scoring the gaps either
+    side of the moved matches for the teams which are actually in them.
+
+    Scores are the same as `_score_many(compute_breaks(schedule))`, though are
+    maintained incrementally so may drift by floating point error over many
+    moves. Use `rescore` to reset them.
+    """
+
+    def __init__(self, schedule: Schedule) -> None:
+        super().__init__()
+        self.schedule = list(schedule)
+        for idx, teams in enumerate(self.schedule):
+            for tla in teams:
+                self.appearances[tla].append(idx)
+        self.rescore()
+
+    def rescore(self) -> None:
+        # Map TLA -> gap -> count, only for gaps which have a finite cost
+        self.gap_counts: DefaultDict[Team, collections.Counter[int]]
+        self.gap_counts = collections.defaultdict(collections.Counter)
+        # Map TLA -> number of gaps which have an infinite cost
+        self.bad_gaps: collections.Counter[Team] = collections.Counter()
+        # Map TLA -> sum of the costs of the finite gaps
+        self.partial_scores: DefaultDict[Team, float] = collections.defaultdict(float)
+
+        # Track infinitely scored teams separately from the others so that
+        # scores can be updated by subtraction without ending up as NaN.
+        self.num_infinite = 0
+        self.finite_total = 0.0
+
+        for tla, positions in self.appearances.items():
+            for last_match, match in pairwise(positions):
+                self._add_gap(tla, match - last_match)
+
+    @property
+    def score(self) -> float:
+        if self.num_infinite:
+            return float('inf')
+        return self.finite_total
+
+    @property
+    def cost(self) -> tuple[int, float]:
+        """
+        A comparable version of the score which still distinguishes between
+        schedules which both have an infinite score.
+        """
+        return self.num_infinite, self.finite_total
+
+    def team_score(self, tla: Team) -> float:
+        if self.bad_gaps[tla]:
+            return float('inf')
+        return self.partial_scores[tla]
 
+    def _add_gap(self, tla: Team, gap: int) -> None:
+        if gap <= 1:
+            bad_gaps = self.bad_gaps[tla] = self.bad_gaps[tla] + 1
+            if bad_gaps == 1:
+                self.num_infinite += 1
+                self.finite_total -= self.partial_scores[tla]
+            return
 
-def _ordered_permute(schedule: Schedule) -> Iterator[Schedule]:
-    return itertools.permutations(schedule)
+        counts = self.gap_counts[tla]
+        count = counts[gap] = counts[gap] + 1
+        # Matches the incremental costs in `_score_breaks`
+        delta = count / gap
+        self.partial_scores[tla] += delta
+        if not self.bad_gaps[tla]:
+            self.finite_total += delta
 
+    def _remove_gap(self, tla: Team, gap: int) -> None:
+        if gap <= 1:
+            bad_gaps = self.bad_gaps[tla] = self.bad_gaps[tla] - 1
+            if not bad_gaps:
+                self.num_infinite -= 1
+                self.finite_total += self.partial_scores[tla]
+            return
 
-class PermuteAdjuster(Protocol):
-    def pre_adjust(self, schedule: Schedule) -> Schedule:
-        ...
+        counts = self.gap_counts[tla]
+        count = counts[gap]
+        counts[gap] = count - 1
+        delta = count / gap
+        self.partial_scores[tla] -= delta
+        if not self.bad_gaps[tla]:
+            self.finite_total -= delta
+
+    def apply(self, changes: Mapping[int, Sequence[Team]]) -> dict[int, Sequence[Team]]:
+        """
+        Replace the matches at the given indices with the given matches,
+        returning the changes needed to undo the move.
+        """
+        undo = {idx: self.schedule[idx] for idx in changes}
+
+        for idx, teams in changes.items():
+            old_teams = self.schedule[idx]
+            for tla in old_teams:
+                if tla not in teams:
+                    self._remove(tla, idx)
+            for tla in teams:
+                if tla not in old_teams:
+                    self._insert(tla, idx)
+            self.schedule[idx] = teams
+
+        return undo
+
+    def swap(self, i: int, j: int) -> dict[int, Sequence[Team]]:
+        return self.apply({i: self.schedule[j], j: self.schedule[i]})
+
+
+class BatchScorer:
+    """
+    Scores many re-orderings of a schedule at once using array operations.
+
+    The schedule is encoded as a matrix of team indices (one row per match),
+    from which we derive a padded matrix of the matches each team is in.
+    Re-orderings are given as rows of a 2-D array, each being the indices of
+    the original matches in their new order.
+    """
+
+    def __init__(self, schedule: Schedule) -> None:
+        interned = helpers.InternedSchedule.from_schedule(schedule)
+        num_teams = interned.num_teams
+
+        self.num_matches = len(interned)
+        # Matches x slots, padded with EMPTY for matches with fewer teams
+        self.matrix = np.array(interned.data, dtype=np.int64).reshape(self.num_matches, interned.width)
+
+        match_nums, slots = np.nonzero(self.matrix != interned.EMPTY)
+        team_nums = self.matrix[match_nums, slots]
+        num_appearances = np.bincount(team_nums, minlength=num_teams)
+        max_appearances = max(num_appearances.max(initial=0), 1)
+
+        # Teams x appearances, padded with -1 for teams with fewer matches.
+        # A stable sort keeps each team's matches in their original order.
+        by_team = np.argsort(team_nums, kind='stable')
+        rank = np.arange(len(team_nums)) - np.repeat(
+            np.cumsum(num_appearances) - num_appearances,
+            num_appearances,
+        )
+        self.team_matches = np.full((num_teams, max_appearances), -1, dtype=np.int64)
+        self.team_matches[team_nums[by_team], rank] = match_nums[by_team]
 
-    def post_adjust(self, schedule: Schedule) -> Schedule:
-        ...
+        # Which of the gaps between consecutive appearances are real
+        self.valid_gaps = (
+            np.arange(max_appearances - 1)[np.newaxis, :]
+            < (num_appearances - 1)[:, np.newaxis]
+        )
 
+    def score(self, orders: npt.NDArray[np.int64]) -> npt.NDArray[np.float64]:
+        """
+        Score a batch of re-orderings, returning one score per row. Scores are
+        the same as `_score_many(compute_breaks(schedule))` for the
+        corresponding schedule.
+        """
+        orders = np.atleast_2d(orders)
+        batch_size = orders.shape[0]
+
+        # The new position of each original match, per candidate
+        positions = np.empty_like(orders)
+        np.put_along_axis(
+            positions,
+            orders,
+            np.broadcast_to(np.arange(self.num_matches), orders.shape),
+            axis=1,
+        )
 
-class NoopAdjuster:
-    def pre_adjust(self, schedule: Schedule) -> Schedule:
-        return schedule
+        # Candidates x teams x appearances. Padding sorts after all real
+        # positions, so the real gaps are always the leading ones.
+        team_positions = np.where(
+            self.team_matches >= 0,
+            positions[:, self.team_matches],
+            self.num_matches,
+        )
+        team_positions.sort(axis=2)
+        gaps = np.diff(team_positions, axis=2)
+
+        valid = np.broadcast_to(self.valid_gaps, gaps.shape)
+        infinite = np.any(valid & (gaps <= 1), axis=(1, 2))
+
+        # Each gap costs the number of times that size of gap has occurred
+        # for the team so far, divided by the size (see `_score_breaks`). Sort
+        # the gaps so that each occurrence's count is its rank within the run
+        # of equal gaps.
+        gaps = np.where(valid, gaps, self.num_matches + 1)
+        gaps.sort(axis=2)
+        idx = np.arange(gaps.shape[2])
+        run_starts = np.ones(gaps.shape, dtype=bool)
+        run_starts[..., 1:] = gaps[..., 1:] != gaps[..., :-1]
+        run_start_idx = np.maximum.accumulate(np.where(run_starts, idx, 0), axis=2)
+        counts = idx - run_start_idx + 1
+
+        valid = gaps <= self.num_matches
+        costs = np.where(valid, counts / np.maximum(gaps, 1), 0)
+        scores: npt.NDArray[np.float64] = costs.reshape(batch_size, -1).sum(axis=1)
+        scores[infinite] = np.inf
+        return scores
 
-    def post_adjust(self, schedule: Schedule) -> Schedule:
-        return schedule
 
+class PermuteAdjuster(Protocol):
+    def window(self, schedule: Schedule) -> range:
+        """
+        The indices of the matches which searches may move.
+        """
+        ...
 
-class ReversingAdjuster:
-    def pre_adjust(self, schedule: Schedule) -> Schedule:
-        return list(reversed(schedule))
 
-    def post_adjust(self, schedule: Schedule) -> Schedule:
-        return list(reversed(schedule))
+class NoopAdjuster:
+    def window(self, schedule: Schedule) -> range:
+        return range(len(schedule))
 
 
+@dataclasses.dataclass(frozen=True)
 class SubsetAdjuster:
-    whole: Schedule
-    # TODO: add a way for these to be specified externally (probably CLI arguments)  # noqa: T000
-    start = 46
-    end = 68
-
-    def pre_adjust(self, schedule: Schedule) -> Schedule:
-        self.whole = schedule[:]
-        return schedule[self.start: self.end]
-
-    def post_adjust(self, schedule: Schedule) -> Schedule:
-        return (  # type: ignore[no-any-return]
-            self.whole[:self.start]  # type: ignore[operator]
-            + list(schedule)
-            + self.whole[self.end:]
-        )
+    start: int = 0
+    end: int | None = None
+
+    def window(self, schedule: Schedule) -> range:
+        end = len(schedule) if self.end is None else min(self.end, len(schedule))
+        return range(min(self.start, end), end)
 
 
-def _get_adjuster(permute_adjuster: str) -> PermuteAdjuster:
-    registry: dict[str, type[PermuteAdjuster]] = {
-        'subset': SubsetAdjuster,
-        'reverse': ReversingAdjuster,
+def _get_adjuster(
+    permute_adjuster: str,
+    subset_start: int = 0,
+    subset_end: int | None = None,
+) -> PermuteAdjuster:
+    registry: dict[str, Callable[[], PermuteAdjuster]] = {
+        'subset': lambda: SubsetAdjuster(subset_start, subset_end),
         NO_PERMUTE_ADJUSTER: NoopAdjuster,
     }
     return registry[permute_adjuster]()
 
 
+@dataclasses.dataclass
+class SearchContext:
+    adjuster: PermuteAdjuster
+    rng: random.Random
+    iterations: int | None = None
+    time_limit: float | None = None
+    initial_temperature: float = DEFAULT_INITIAL_TEMPERATURE
+    final_temperature: float = DEFAULT_FINAL_TEMPERATURE
+    batch_size: int = DEFAULT_BATCH_SIZE
+    checkpoint_file: Path | None = None
+    checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL
+    window_size: int | None = None
+    window_overlap: int = DEFAULT_WINDOW_OVERLAP
+    window_iterations: int = DEFAULT_WINDOW_ITERATIONS
+    # How much of the budget was used before the search was resumed
+    completed_iterations: int = 0
+    elapsed: float = 0
+
+    @property
+    def remaining_iterations(self) -> int | None:
+        if self.iterations is None:
+            return None
+        return max(self.iterations - self.completed_iterations, 0)
+
+    @property
+    def remaining_time(self) -> float | None:
+        if self.time_limit is None:
+            return None
+        return self.time_limit - self.elapsed
+
+    def progress(self, iteration: int, elapsed: float) -> float | None:
+        """
+        How much of the budget for the search has been used, as a fraction, or
+        `None` if the search is unbounded.
+        """
+        fractions = []
+        if self.iterations is not None:
+            fractions.append((self.completed_iterations + iteration) / self.iterations)
+        if self.time_limit is not None:
+            fractions.append((self.elapsed + elapsed) / self.time_limit)
+        return max(fractions, default=None)
+
+
+RandomState = Tuple[int, Tuple[int, ...], Optional[float]]
+
+
+@dataclasses.dataclass(frozen=True)
+class Checkpoint:
+    """
+    The state of a search, saved periodically so that it can be resumed.
+    """
+    score: float
+    schedule: Schedule
+    rng_state: RandomState
+    iterations: int
+    elapsed: float
+
+    def save(self, path: Path) -> None:
+        data = {
+            'score': self.score,
+            'schedule': [list(x) for x in self.schedule],
+            'rng_state': self.rng_state,
+            'iterations': self.iterations,
+            'elapsed': self.elapsed,
+        }
+        # Write then rename so that a pre-empted save doesn't lose the last one
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Checkpoint:
+        data = json.loads(path.read_text())
+        version, internal_state, gauss_next = data['rng_state']
+        return cls(
+            score=data['score'],
+            schedule=[tuple(Team(x) for x in teams) for teams in data['schedule']],
+            rng_state=(version, tuple(internal_state), gauss_next),
+            iterations=data['iterations'],
+            elapsed=data['elapsed'],
+        )
+
+
+# A search yields a score and the schedule it scores for each candidate it
+# evaluates. The schedule yielded may be modified by the search after it is
+# yielded, so must be copied if it is to be kept.
+Search = Callable[[Schedule, SearchContext], Iterator[tuple[float, Schedule]]]
+
+
+def _random_search(schedule: Schedule, context: SearchContext) -> Iterator[tuple[float, Schedule]]:
+    """
+    Randomly shuffle the matches within the adjuster's window, scoring the
+    shuffles in batches.
+    """
+    scorer = BatchScorer(schedule)
+    window = context.adjuster.window(schedule)
+    identity = np.arange(len(schedule))
+
+    while True:
+        # Derive the generator from the context's so that its state is all
+        # that's needed to reproduce the search.
+        np_rng = np.random.default_rng(context.rng.getrandbits(64))
+        orders = np.tile(identity, (context.batch_size, 1))
+        orders[:, window.start:window.stop] = np_rng.permuted(
+            orders[:, window.start:window.stop],
+            axis=1,
+        )
+
+        for score, order in zip(scorer.score(orders).tolist(), orders.tolist()):
+            yield score, [schedule[x] for x in order]
+
+
+def _swap_search(schedule: Schedule, context: SearchContext) -> Iterator[tuple[float, Schedule]]:
+    """
+    Hill-climb by swapping random pairs of matches, keeping any swap which
+    doesn't make things worse. Only the teams in the swapped matches are
+    re-scored for each swap.
+    """
+    index = BreaksIndex(schedule)
+    window = context.adjuster.window(schedule)
+    if len(window) < 2:
+        return
+
+    while True:
+        before = index.cost
+        undo = index.swap(*context.rng.sample(window, 2))
+        if index.cost > before:
+            index.apply(undo)
+        yield index.score, index.schedule
+
+
+Move = Callable[[BreaksIndex, range, random.Random], dict[int, Sequence[Team]]]
+
+
+def _swap_move(index: BreaksIndex, window: range, rng: random.Random) -> dict[int, Sequence[Team]]:
+    return index.swap(*rng.sample(window, 2))
+
+
+def _random_segment(window: range, rng: random.Random, min_length: int) -> tuple[int, int]:
+    length = rng.randint(min_length, min(ANNEAL_MAX_SEGMENT, len(window)))
+    start = rng.randint(window.start, window.stop - length)
+    return start, start + length
+
+
+def _block_move(index: BreaksIndex, window: range, rng: random.Random) -> dict[int, Sequence[Team]]:
+    # Moving a block of matches past some others is the same as rotating the
+    # segment which contains both of them.
+    start, end = _random_segment(window, rng, min_length=2)
+    segment = index.schedule[start:end]
+    pivot = rng.randint(1, len(segment) - 1)
+    segment = segment[pivot:] + segment[:pivot]
+    return index.apply(dict(zip(range(start, end), segment)))
+
+
+def _reverse_move(index: BreaksIndex, window: range, rng: random.Random) -> dict[int, Sequence[Team]]:
+    start, end = _random_segment(window, rng, min_length=2)
+    segment = index.schedule[start:end]
+    return index.apply(dict(zip(range(start, end), reversed(segment))))
+
+
+ANNEAL_MOVES: list[Move] = [_swap_move, _block_move, _reverse_move]
+
+
+def _anneal_search(schedule: Schedule, context: SearchContext) -> Iterator[tuple[float, Schedule]]:
+    """
+    Simulated annealing using a mix of swapping matches, moving blocks of
+    matches and reversing runs of matches. Worse schedules are accepted with a
+    probability which shrinks as the temperature cools over the budget for the
+    search; moves which introduce back-to-back matches are never accepted.
+    """
+    index = BreaksIndex(schedule)
+    window = context.adjuster.window(schedule)
+    if len(window) < 2:
+        return
+
+    rng = context.rng
+    temperature_ratio = context.final_temperature / context.initial_temperature
+    started = time.monotonic()
+
+    for iteration in itertools.count():
+        progress = context.progress(iteration, time.monotonic() - started)
+        if progress is None:
+            progress = iteration / DEFAULT_ANNEAL_ITERATIONS
+        if progress >= 1:
+            return
+
+        temperature = context.initial_temperature * temperature_ratio ** progress
+
+        before_infinite, before_total = index.cost
+        undo = rng.choice(ANNEAL_MOVES)(index, window, rng)
+        after_infinite, after_total = index.cost
+
+        if after_infinite != before_infinite:
+            accept = after_infinite < before_infinite
+        else:
+            delta = after_total - before_total
+            accept = delta <= 0 or rng.random() < math.exp(-delta / temperature)
+
+        if not accept:
+            index.apply(undo)
+
+        yield index.score, index.schedule
+
+
+def _exact_search(schedule: Schedule, context: SearchContext) -> Iterator[tuple[float, Schedule]]:
+    """
+    Branch and bound search for the best order of the matches within the
+    adjuster's window, holding the matches outside it fixed.
+
+    The order is built up one match at a time, pruning any partial order which
+    cannot improve on the best found so far. Only complete orders which
+    improve on the best are yielded, so once the search finishes the last
+    schedule yielded is optimal.
+
+    Teams which already have a back-to-back gap outside the window have an
+    infinite score whatever the order within it, so are left out of the
+    search's objective. The search thus still improves the rest of the
+    schedule, though the scores it yields remain infinite.
+    """
+    window = context.adjuster.window(schedule)
+    schedule = list(schedule)
+
+    deadline = None
+    if context.time_limit is not None:
+        deadline = time.monotonic() + context.time_limit
+
+    # Teams with a back-to-back gap which the search can't change, since
+    # neither of its matches is in the window
+    fixed_infinite: set[Team] = set()
+    last_appearance: dict[Team, int] = {}
+    for idx, teams in enumerate(schedule):
+        for tla in teams:
+            last = last_appearance.get(tla)
+            if (
+                last is not None
+                and idx - last <= 1
+                and last not in window
+                and idx not in window
+            ):
+                fixed_infinite.add(tla)
+            last_appearance[tla] = idx
+
+    def counted(teams: Iterable[Team]) -> list[Team]:
+        return [x for x in teams if x not in fixed_infinite]
+
+    best = sum(
+        _score(x)
+        for x in compute_breaks(schedule)
+        if x.tla not in fixed_infinite
+    )
+
+    # The matches after the window are fixed, so we can count their gaps up
+    # front. Since the k-th gap of a given size costs k/size, the total score
+    # is then the cost of the suffix's gaps plus the costs of every other gap
+    # counted as if it came after the suffix's gaps.
+    suffix_counts: DefaultDict[Team, collections.Counter[int]]
+    suffix_counts = collections.defaultdict(collections.Counter)
+    suffix_first: dict[Team, int] = {}
+    suffix_last: dict[Team, int] = {}
+    for idx in range(window.stop, len(schedule)):
+        for tla in counted(schedule[idx]):
+            if tla in suffix_last:
+                suffix_counts[tla][idx - suffix_last[tla]] += 1
+            else:
+                suffix_first[tla] = idx
+            suffix_last[tla] = idx
+
+    suffix_cost = sum(_score_breaks(x.elements()) for x in suffix_counts.values())
+
+    # Map TLA -> gap -> count, for the gaps before the end of the window
+    counts: DefaultDict[Team, collections.Counter[int]] = collections.defaultdict(collections.Counter)
+    last_seen: dict[Team, int] = {}
+
+    def gap_cost(tla: Team, gap: int) -> float:
+        if gap <= 1:
+            return float('inf')
+        return (counts[tla][gap] + suffix_counts[tla][gap] + 1) / gap
+
+    def match_cost(teams: Sequence[Team], idx: int) -> float:
+        return sum(
+            gap_cost(tla, idx - last_seen[tla])
+            for tla in counted(teams)
+            if tla in last_seen
+        )
+
+    def place(teams: Sequence[Team], idx: int) -> list[tuple[Team, int | None]]:
+        undo = []
+        for tla in teams:
+            last = last_seen.get(tla)
+            if last is not None:
+                counts[tla][idx - last] += 1
+            undo.append((tla, last))
+            last_seen[tla] = idx
+        return undo
+
+    def unplace(undo: list[tuple[Team, int | None]], idx: int) -> None:
+        for tla, last in undo:
+            if last is None:
+                del last_seen[tla]
+            else:
+                counts[tla][idx - last] -= 1
+                last_seen[tla] = last
+
+    partial = 0.0
+    for idx in range(window.start):
+        partial += match_cost(schedule[idx], idx)
+        place(schedule[idx], idx)
+
+    movable = schedule[window.start:window.stop]
+    used = [False] * len(movable)
+    remaining = collections.Counter(tla for teams in movable for tla in counted(teams))
+
+    # Teams not in the window have a fixed gap across it
+    for tla, first in suffix_first.items():
+        if tla not in remaining and tla in last_seen:
+            partial += gap_cost(tla, first - last_seen[tla])
+
+    if math.isinf(partial + suffix_cost):
+        # Nothing we can do within the window will help
+        return
+
+    # Teams in the window which have a gap across into the suffix
+    crossing_teams = [(tla, first) for tla, first in suffix_first.items() if tla in remaining]
+
+    # The gaps each team has before the search starts. Gaps only cost more as
+    # more are added, so costing gaps against these gives a lower bound.
+    fixed_counts = {tla: counts[tla] + suffix_counts[tla] for tla in remaining}
+    team_bounds: dict[tuple[Team, int | None, int, int], float] = {}
+
+    def team_bound(tla: Team, last: int | None, idx: int, num_remaining: int) -> float:
+        """
+        The least that the gaps a team has yet to add can cost, placing its
+        remaining matches in the rest of the window without regard for where
+        the other teams' matches go.
+        """
+        key = (tla, last, idx, num_remaining)
+        if key in team_bounds:
+            return team_bounds[key]
+
+        fixed = fixed_counts[tla]
+
+        def cost(gap: int) -> float:
+            if gap <= 1:
+                return float('inf')
+            return (fixed[gap] + 1) / gap
+
+        positions = range(idx, window.stop)
+
+        # The least the team's gaps can cost up to its next match, for each
+        # position that match could be in
+        costs = [0.0 if last is None else cost(pos - last) for pos in positions]
+        for _ in range(num_remaining - 1):
+            costs = [
+                min(
+                    (costs[prev - idx] + cost(pos - prev) for prev in range(idx, pos - 1)),
+                    default=float('inf'),
+                )
+                for pos in positions
+            ]
+
+        first = suffix_first.get(tla)
+        if first is not None:
+            costs = [x + cost(first - pos) for x, pos in zip(costs, positions)]
+
+        bound = team_bounds[key] = min(costs, default=float('inf'))
+        return bound
+
+    def remaining_bound(idx: int) -> float:
+        """
+        A lower bound on the cost of the gaps which the teams in the window
+        have yet to add. Once a team has been placed for the last time its
+        gap to the suffix is known, otherwise each team's gaps are bounded
+        separately.
+        """
+        total = 0.0
+        for tla, num_remaining in remaining.items():
+            last = last_seen.get(tla)
+            if num_remaining:
+                total += team_bound(tla, last, idx, num_remaining)
+            elif last is not None and tla in suffix_first:
+                total += gap_cost(tla, suffix_first[tla] - last)
+        return total
+
+    def finish() -> float:
+        return sum(gap_cost(tla, first - last_seen[tla]) for tla, first in crossing_teams)
+
+    def search(idx: int, partial: float) -> Iterator[tuple[float, Schedule]]:
+        nonlocal best
+
+        if deadline is not None and time.monotonic() > deadline:
+            return
+
+        if idx == window.stop:
+            score = partial + finish() + suffix_cost
+            if score < best - SCORE_TOLERANCE:
+                best = score
+                yield (float('inf') if fixed_infinite else score), schedule
+            return
+
+        candidates = []
+        seen = set()
+        for num, teams in enumerate(movable):
+            # Matches with the same teams are interchangeable, so only try one
+            key = frozenset(teams)
+            if used[num] or key in seen:
+                continue
+            seen.add(key)
+
+            cost = match_cost(teams, idx)
+            if not math.isinf(cost):
+                candidates.append((cost, num))
+
+        # Try the cheapest options first, so that good orders are found early
+        # and bound the rest of the search more tightly.
+        candidates.sort()
+
+        for cost, num in candidates:
+            if partial + cost + suffix_cost >= best - SCORE_TOLERANCE:
+                # All the remaining candidates cost at least as much
+                break
+
+            teams = movable[num]
+            used[num] = True
+            schedule[idx] = teams
+            undo = place(teams, idx)
+            remaining.subtract(counted(teams))
+
+            bound = partial + cost + suffix_cost + remaining_bound(idx + 1)
+            if bound < best - SCORE_TOLERANCE:
+                yield from search(idx + 1, partial + cost)
+
+            remaining.update(counted(teams))
+            unplace(undo, idx)
+            used[num] = False
+
+    yield from search(window.start, partial)
+
+
+SEARCHES: dict[str, Search] = {
+    'random': _random_search,
+    'ordered': _exact_search,
+    'swap': _swap_search,
+    'anneal': _anneal_search,
+}
+
+
+def _is_lower_cost(cost: tuple[int, float], than: tuple[int, float]) -> bool:
+    return cost[0] < than[0] or (cost[0] == than[0] and cost[1] < than[1] - SCORE_TOLERANCE)
+
+
+def _sliding_window(search: Search) -> Search:
+    """
+    Wrap a search so that it optimises one window of matches at a time,
+    sliding an overlapping window across the adjuster's window. The matches
+    either side of each window are held fixed, though still count towards the
+    score. Sweeps are repeated until one makes no improvement.
+    """
+
+    def sliding_search(schedule: Schedule, context: SearchContext) -> Iterator[tuple[float, Schedule]]:
+        assert context.window_size is not None
+        size = context.window_size
+        step = max(size - context.window_overlap, 1)
+        outer = context.adjuster.window(schedule)
+
+        last_start = max(outer.stop - size, outer.start)
+        starts = [*range(outer.start, last_start, step), last_start]
+
+        current = list(schedule)
+        current_index = BreaksIndex(current)
+        current_cost, current_score = current_index.cost, current_index.score
+
+        improved = True
+        while improved:
+            improved = False
+            for start in starts:
+                window_context = dataclasses.replace(
+                    context,
+                    adjuster=SubsetAdjuster(start, min(start + size, outer.stop)),
+                    iterations=context.window_iterations,
+                    time_limit=None,
+                    completed_iterations=0,
+                    elapsed=0,
+                )
+                candidates = itertools.islice(
+                    search(current, window_context),
+                    context.window_iterations,
+                )
+
+                window_best = None
+                window_best_score = float('inf')
+                last = None
+                for score, permutation in candidates:
+                    if score < window_best_score:
+                        window_best = list(permutation)
+                        window_best_score = score
+                    # Searches may modify what they've yielded, so copy it
+                    last = list(permutation)
+                    if math.isinf(score):
+                        # Report what's been kept so far instead, so that the
+                        # progress made removing back-to-back matches isn't lost
+                        yield current_score, current
+                    else:
+                        yield score, permutation
+
+                # Compare on cost rather than score so that progress towards
+                # removing back-to-back matches is kept between windows.
+                for option in (window_best, last):
+                    if option is None:
+                        continue
+                    index = BreaksIndex(option)
+                    if _is_lower_cost(index.cost, current_cost):
+                        current = list(option)
+                        current_cost, current_score = index.cost, index.score
+                        improved = True
+
+    return sliding_search
+
+
+def _get_search(search_name: str, context: SearchContext) -> Search:
+    search = SEARCHES[search_name]
+    if context.window_size is not None:
+        search = _sliding_window(search)
+    return search
+
+
 def _handle_permutations(
     min_breaks: list[TeamBreaks],
     schedule: Schedule,
-    permuter: Callable[[Schedule], Iterator[Schedule]],
-    adjuster: PermuteAdjuster,
+    search: Search,
+    context: SearchContext,
 ) -> Schedule:
     best: tuple[float, list[TeamBreaks], Schedule]
     best = (_score_many(min_breaks), min_breaks, schedule[:])
 
     print(best[0])
 
+    started = time.monotonic()
+    deadline = None
+    if context.remaining_time is not None:
+        deadline = started + context.remaining_time
+
+    last_saved = started
+    count = 0
+
+    # Sliding windows report the schedule they've kept while it still has
+    # back-to-back matches, so compare those on cost to keep their progress.
+    # Only re-cost when that schedule changes, since costing is slow.
+    compare_costs = context.window_size is not None
+    best_cost = BreaksIndex(schedule).cost if compare_costs else None
+    costed = schedule
+
+    def checkpoint() -> Checkpoint:
+        return Checkpoint(
+            score=best[0],
+            schedule=best[2],
+            rng_state=context.rng.getstate(),
+            iterations=context.completed_iterations + count,
+            elapsed=context.elapsed + time.monotonic() - started,
+        )
+
     try:
-        schedule = adjuster.pre_adjust(schedule)
-
-        bar = tqdm.tqdm(permuter(schedule))
-        for permutation in bar:
-            permutation = adjuster.post_adjust(permutation)
-            min_breaks = compute_breaks(permutation)
-            score = _score_many(min_breaks)
-            if score < best[0]:
+        bar = tqdm.tqdm(
+            itertools.islice(search(schedule, context), context.remaining_iterations),
+            initial=context.completed_iterations,
+            total=context.iterations,
+        )
+        for score, permutation in bar:
+            count += 1
+            if score < best[0] - SCORE_TOLERANCE:
                 bar.write(f"Better! {score}")
-                best = (score, min_breaks, permutation)
+                min_breaks = compute_breaks(permutation)
+                best = (score, min_breaks, list(permutation))
+            elif best_cost is not None and math.isinf(best[0]) and permutation is not costed:
+                costed = permutation
+                cost = BreaksIndex(permutation).cost
+                if _is_lower_cost(cost, best_cost):
+                    bar.write(f"Better! {score} ({cost[0]} teams with back-to-back matches)")
+                    min_breaks = compute_breaks(permutation)
+                    best = (score, min_breaks, list(permutation))
+                    best_cost = cost
+
+            now = time.monotonic()
+            if deadline is not None and now > deadline:
+                break
+
+            if context.checkpoint_file and now - last_saved > context.checkpoint_interval:
+                checkpoint().save(context.checkpoint_file)
+                last_saved = now
     except KeyboardInterrupt:
         pass
 
+    if context.checkpoint_file:
+        checkpoint().save(context.checkpoint_file)
+
     score, min_breaks, permutation = best
     print(score)
 
     return permutation
 
 
+@dataclasses.dataclass(frozen=True)
+class SharedBest:
+    """
+    The best schedule found by any parallel search worker, stored as the
+    order of the matches within the original schedule.
+    """
+    score: Synchronized[float]
+    order: SynchronizedArray[int]
+    iterations: Synchronized[int]
+    stop: multiprocessing.synchronize.Event
+
+    @classmethod
+    def create(cls, score: float, num_matches: int) -> SharedBest:
+        return cls(
+            score=multiprocessing.Value('d', score),
+            order=multiprocessing.Array('i', range(num_matches)),
+            iterations=multiprocessing.Value('q', 0),
+            stop=multiprocessing.Event(),
+        )
+
+    def offer(self, score: float, order: Sequence[int]) -> tuple[float, list[int]]:
+        """
+        Offer a candidate best, returning whichever is now the best overall.
+        """
+        with self.score.get_lock():
+            if score < self.score.value - SCORE_TOLERANCE:
+                self.score.value = score
+                self.order[:] = order
+            return self.score.value, self.order[:]
+
+    def add_iterations(self, count: int) -> None:
+        with self.iterations.get_lock():
+            self.iterations.value += count
+
+
+_shared_best: SharedBest | None = None
+
+
+def _init_worker(shared_best: SharedBest) -> None:
+    global _shared_best
+    _shared_best = shared_best
+    # Interrupts are handled by the parent, which tells the workers to stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _to_order(original: Schedule, schedule: Schedule) -> list[int]:
+    indices: DefaultDict[Sequence[Team], list[int]] = collections.defaultdict(list)
+    for idx, teams in enumerate(original):
+        indices[teams].append(idx)
+    return [indices[teams].pop(0) for teams in schedule]
+
+
+def _parallel_worker(
+    original: Schedule,
+    search_name: str,
+    context: SearchContext,
+    restart_interval: int,
+) -> None:
+    """
+    Run the given search in epochs of `restart_interval` candidates. After
+    each epoch the best schedule found is shared with the other workers and
+    the next epoch starts from the best schedule any worker has found.
+    """
+    assert _shared_best is not None, "Worker not initialised"
+    shared_best = _shared_best
+
+    search = _get_search(search_name, context)
+
+    deadline = None
+    if context.remaining_time is not None:
+        deadline = time.monotonic() + context.remaining_time
+    remaining = context.remaining_iterations
+
+    best_score, best_order = shared_best.offer(float('inf'), [])
+    while not shared_best.stop.is_set():
+        # Searches which rarely yield can only stop themselves, so give each
+        # epoch what's left of the time budget.
+        epoch_context = dataclasses.replace(
+            context,
+            iterations=restart_interval,
+            time_limit=None if deadline is None else deadline - time.monotonic(),
+            completed_iterations=0,
+            elapsed=0,
+        )
+        epoch_best: tuple[float, Schedule] | None = None
+        count = 0
+        next_check = time.monotonic() + WORKER_STOP_CHECK_INTERVAL
+        schedule = [original[x] for x in best_order]
+        for score, permutation in itertools.islice(search(schedule, epoch_context), restart_interval):
+            count += 1
+            if score < (epoch_best[0] if epoch_best else best_score) - SCORE_TOLERANCE:
+                epoch_best = (score, list(permutation))
+
+            now = time.monotonic()
+            if now > next_check:
+                if shared_best.stop.is_set():
+                    break
+                if deadline is not None and now > deadline:
+                    break
+                next_check = now + WORKER_STOP_CHECK_INTERVAL
+
+        shared_best.add_iterations(count)
+
+        if epoch_best is not None:
+            score, permutation = epoch_best
+            best_score, best_order = shared_best.offer(score, _to_order(original, permutation))
+        else:
+            best_score, best_order = shared_best.offer(best_score, best_order)
+
+        if remaining is not None:
+            remaining -= count
+            if remaining <= 0:
+                return
+        if deadline is not None and time.monotonic() > deadline:
+            return
+        if count < restart_interval and not shared_best.stop.is_set():
+            # The search ran out of candidates
+            return
+
+
+def _handle_parallel_permutations(
+    min_breaks: list[TeamBreaks],
+    schedule: Schedule,
+    search_name: str,
+    context: SearchContext,
+    workers: int,
+    restart_interval: int,
+) -> Schedule:
+    shared_best = SharedBest.create(_score_many(min_breaks), len(schedule))
+    print(shared_best.score.value)
+
+    worker_context = context
+    if context.remaining_iterations is not None:
+        worker_context = dataclasses.replace(
+            context,
+            iterations=math.ceil(context.remaining_iterations / workers),
+            completed_iterations=0,
+        )
+
+    started = time.monotonic()
+    last_saved = started
+
+    def checkpoint() -> Checkpoint:
+        score, order = shared_best.offer(float('inf'), [])
+        return Checkpoint(
+            score=score,
+            schedule=[schedule[x] for x in order],
+            rng_state=context.rng.getstate(),
+            iterations=context.completed_iterations + shared_best.iterations.value,
+            elapsed=context.elapsed + time.monotonic() - started,
+        )
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(shared_best,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                _parallel_worker,
+                schedule,
+                search_name,
+                # Derive the seeds from the main generator so that seeded runs
+                # are reproducible, at least for each worker's first epoch.
+                dataclasses.replace(
+                    worker_context,
+                    rng=random.Random(context.rng.getrandbits(64)),
+                ),
+                restart_interval,
+            )
+            for _ in range(workers)
+        ]
+
+        bar = tqdm.tqdm(initial=context.completed_iterations, total=context.iterations)
+        reported = shared_best.score.value
+        pending = set(futures)
+        while pending:
+            try:
+                _, pending = concurrent.futures.wait(pending, timeout=WORKER_POLL_INTERVAL)
+            except KeyboardInterrupt:
+                shared_best.stop.set()
+
+            bar.update(context.completed_iterations + shared_best.iterations.value - bar.n)
+            score = shared_best.score.value
+            if score < reported:
+                bar.write(f"Better! {score}")
+                reported = score
+
+            now = time.monotonic()
+            if context.checkpoint_file and now - last_saved > context.checkpoint_interval:
+                checkpoint().save(context.checkpoint_file)
+                last_saved = now
+
+        bar.close()
+
+        if context.checkpoint_file:
+            checkpoint().save(context.checkpoint_file)
+
+        for future in futures:
+            # Surface any errors from the workers
+            future.result()
+
+    score, order = shared_best.offer(float('inf'), [])
+    print(score)
+
+    return [schedule[x] for x in order]
+
+
 def main(
     schedule_file: Path,
     permute: str = NO_PERMUTE,
     permute_adjuster: str = NO_PERMUTE_ADJUSTER,
+    subset_start: int = 0,
+    subset_end: int | None = None,
+    iterations: int | None = None,
+    time_limit: float | None = None,
+    seed: int | None = None,
+    initial_temperature: float = DEFAULT_INITIAL_TEMPERATURE,
+    final_temperature: float = DEFAULT_FINAL_TEMPERATURE,
+    workers: int = 1,
+    restart_interval: int = DEFAULT_RESTART_INTERVAL,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    checkpoint: Path | None = None,
+    checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+    resume: bool = False,
+    window_size: int | None = None,
+    window_overlap: int = DEFAULT_WINDOW_OVERLAP,
+    window_iterations: int = DEFAULT_WINDOW_ITERATIONS,
 ) -> None:
     schedule = helpers.load_schedule(schedule_file)
 
+    context = SearchContext(
+        adjuster=_get_adjuster(permute_adjuster, subset_start, subset_end),
+        rng=random.Random(seed),
+        iterations=iterations,
+        time_limit=time_limit,
+        initial_temperature=initial_temperature,
+        final_temperature=final_temperature,
+        batch_size=batch_size,
+        checkpoint_file=checkpoint,
+        checkpoint_interval=checkpoint_interval,
+        window_size=window_size,
+        window_overlap=window_overlap,
+        window_iterations=window_iterations,
+    )
+
+    if resume:
+        if checkpoint is None:
+            print("A checkpoint file is required in order to resume", file=sys.stderr)
+            sys.exit(1)
+
+        saved = Checkpoint.load(checkpoint)
+        if collections.Counter(saved.schedule) != collections.Counter(schedule):
+            print("Checkpoint does not contain the matches in the schedule", file=sys.stderr)
+            sys.exit(1)
+
+        schedule = list(saved.schedule)
+        context.rng.setstate(saved.rng_state)
+        context.completed_iterations = saved.iterations
+        context.elapsed = saved.elapsed
+
     min_breaks = compute_breaks(schedule)
 
     if permute != NO_PERMUTE:
-        permutation = _handle_permutations(
-            min_breaks,
-            tuple(schedule),
-            permuter={
-                'random': _random_permute,
-                'ordered': _ordered_permute,
-            }[permute],
-            adjuster=_get_adjuster(permute_adjuster),
-        )
+        if workers > 1:
+            permutation = _handle_parallel_permutations(
+                min_breaks,
+                tuple(schedule),
+                search_name=permute,
+                context=context,
+                workers=workers,
+                restart_interval=restart_interval,
+            )
+        else:
+            permutation = _handle_permutations(
+                min_breaks,
+                tuple(schedule),
+                search=_get_search(permute, context),
+                context=context,
+            )
 
         if permutation == schedule:
             print("No improvement")
             return
 
-    print('Team\tMin-gap\tCount\tGaps')
-
-    count_n = 0
-    for team_breaks in sorted(min_breaks, key=_sort_key):
-        if team_breaks.min_break == WARN_MIN_GAP:
-            count_n += 1
-        print("\t".join(str(x) for x in (
-            team_breaks.tla,
-            team_breaks.min_break,
-            team_breaks.min_break_count,
-            team_breaks.breaks,
-        )))
-
-    print()
-    print(f"{count_n} teams have a minimum gap of {WARN_MIN_GAP}")
+    print(ClosenessResult(min_breaks).render(), end='')
 
     if permute != NO_PERMUTE:
         print()
@@ -243,17 +1316,154 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument('schedule_file', type=Path, help="Schedule file to inspect")
     parser.add_argument(
         '--permute',
-        choices=('random', 'ordered', NO_PERMUTE),
+        choices=(*SEARCHES.keys(), NO_PERMUTE),
         default=NO_PERMUTE,
-        help="Attempt to improve closeness by permuting the matches",
+        help=(
+            "Attempt to improve closeness by permuting the matches. The 'swap' "
+            "search moves individual matches, only re-scoring affected teams. "
+            "The 'anneal' search uses simulated annealing from the given schedule. "
+            "The 'ordered' search finds the optimal order exhaustively using "
+            "branch and bound. It is only practical for about a dozen matches at a "
+            "time, so use it with a subset or a --window-size of that size."
+        ),
     )
     parser.add_argument(
         '--permute-adjuster',
-        choices=('reverse', 'subset', NO_PERMUTE_ADJUSTER),
+        choices=('subset', NO_PERMUTE_ADJUSTER),
         default=NO_PERMUTE_ADJUSTER,
-        help="Adjust the lines before attempting to permute them",
+        help="Restrict which of the lines may be moved when permuting",
+    )
+    parser.add_argument(
+        '--subset-start',
+        type=int,
+        default=0,
+        help="Index of the first match the 'subset' adjuster may move (default: %(default)s)",
+    )
+    parser.add_argument(
+        '--subset-end',
+        type=int,
+        help=(
+            "Index after the last match the 'subset' adjuster may move "
+            "(default: the end of the schedule)"
+        ),
+    )
+    parser.add_argument(
+        '--iterations',
+        type=int,
+        help="Stop permuting after this many candidates (default: unlimited)",
+    )
+    parser.add_argument(
+        '--time-limit',
+        type=float,
+        metavar='SECONDS',
+        help="Stop permuting after this long (default: unlimited)",
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help="Seed for the random number generator used when permuting",
+    )
+    parser.add_argument(
+        '--initial-temperature',
+        type=float,
+        default=DEFAULT_INITIAL_TEMPERATURE,
+        help="Starting temperature for the 'anneal' search (default: %(default)s)",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        '--final-temperature',
+        type=float,
+        default=DEFAULT_FINAL_TEMPERATURE,
+        help=(
+            "Temperature the 'anneal' search cools to by the end of its budget. "
+            f"If no budget is given, {DEFAULT_ANNEAL_ITERATIONS} iterations are "
+            "assumed. (default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        '--window-size',
+        type=int,
+        help=(
+            "Optimise a sliding window of this many matches at a time, holding "
+            "the matches either side fixed, rather than the whole schedule at once"
+        ),
+    )
+    parser.add_argument(
+        '--window-overlap',
+        type=int,
+        default=DEFAULT_WINDOW_OVERLAP,
+        help="Number of matches shared by consecutive windows (default: %(default)s)",
+    )
+    parser.add_argument(
+        '--window-iterations',
+        type=int,
+        default=DEFAULT_WINDOW_ITERATIONS,
+        help=(
+            "Number of candidates to consider in each window before moving on "
+            "to the next (default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=(
+            "Number of shuffles the 'random' search scores at once using array "
+            "operations (default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help=(
+            "Number of processes to search in parallel. Each worker uses its "
+            "own seed and they share the best schedule found. Not supported by "
+            "the 'ordered' search, which is deterministic. (default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        '--restart-interval',
+        type=int,
+        default=DEFAULT_RESTART_INTERVAL,
+        help=(
+            "Number of candidates each parallel worker evaluates before sharing "
+            "its best schedule and restarting from the best overall. For the "
+            "'anneal' search this is also the length of each annealing cycle. "
+            "(default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        '--checkpoint',
+        type=Path,
+        metavar='FILE',
+        help=(
+            "Periodically save the state of the search to this file, including "
+            "the best schedule found so far"
+        ),
+    )
+    parser.add_argument(
+        '--checkpoint-interval',
+        type=float,
+        default=DEFAULT_CHECKPOINT_INTERVAL,
+        metavar='SECONDS',
+        help="How often to save the checkpoint (default: %(default)s)",
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help=(
+            "Resume the search saved in the checkpoint file. The budget given "
+            "by --iterations and --time-limit includes what was already used."
+        ),
+    )
+    args = parser.parse_args()
+
+    if args.permute == 'ordered' and args.workers > 1:
+        # Every worker would run the same search, and it can't be stopped
+        # other than by its time limit as it rarely yields.
+        parser.error("The 'ordered' search can't be run with --workers")
+
+    return args
 
 
 if __name__ == '__main__':
@@ -2,18 +2,35 @@
 
 from __future__ import annotations
 
+import io
 import math
 import random
 import argparse
-from typing import Sequence
+import dataclasses
+from typing import Iterable, Sequence, DefaultDict
 from pathlib import Path
-from itertools import chain
+from itertools import chain, permutations
 from collections import Counter, defaultdict
 
+import numpy as np
 import helpers
+import numpy.typing as npt
+from analysis import AnalysisContext
 
 _DEFAULT_NUM_CORNERS = 4
 
+# Number of team appearances to count corners for at a time
+_BATCH_SIZE = 100_000
+# Number of team appearances to simulate at a time, enough to make good use of
+# the array operations without holding too much in memory at once
+_SIMULATION_BATCH_SIZE = 1_000_000
+
+# Minimise the total of the teams' standard deviations, or the largest
+OBJECTIVE_TOTAL = 'total'
+OBJECTIVE_MAX = 'max'
+OBJECTIVES = (OBJECTIVE_TOTAL, OBJECTIVE_MAX)
+_DEFAULT_OBJECTIVE = OBJECTIVE_TOTAL
+
 
 def mean(numbers):
     assert numbers
@@ -31,7 +48,7 @@ def variance(numbers):
     return mean(square_deviations)
 
 
-def standard_deviation(numbers):
+def standard_deviation(numbers: Sequence[float]) -> float:
     assert numbers
 
     return math.sqrt(variance(numbers))
@@ -59,39 +76,112 @@ def load_schedule(file_path, num_corners):
     return schedule
 
 
-def convert(schedule, teams_to_ignore=()):
-    # Maps team -> corner -> count
-    teams = defaultdict(Counter)
+@dataclasses.dataclass(frozen=True)
+class CornerCounts:
+    teams: list[str]
+    # Team x corner count of appearances, rows in the order of `teams`
+    counts: npt.NDArray[np.int64]
+    # Game x corner team indices, if kept
+    games: npt.NDArray[np.int64] | None = None
+
+    @property
+    def std_devs(self) -> npt.NDArray[np.float64]:
+        return std_devs(self.counts)
+
+
+def std_devs(counts: npt.NDArray[np.int64]) -> npt.NDArray[np.float64]:
+    """
+    The standard deviation of each row of counts, along the last axis.
+    """
+    return np.asarray(counts.std(axis=-1), dtype=np.float64)
+
+
+def count_corners(
+    schedule: Iterable[Sequence[str]],
+    num_corners: int,
+    keep_games: bool = False,
+) -> CornerCounts:
+    """
+    Count how often each team is in each corner. Matches are counted in
+    batches so that only the counts (and the games, if kept) are held in
+    memory.
+    """
+    team_ids: dict[str, int] = {}
+    counts = np.zeros((0, num_corners), dtype=np.int64)
+    games = []
+    batch: list[int] = []
+
+    def flush() -> None:
+        nonlocal counts
+        batch_games = np.array(batch, dtype=np.int64).reshape(-1, num_corners)
+        batch_counts = np.bincount(
+            (batch_games * num_corners + np.arange(num_corners)).ravel(),
+            minlength=len(team_ids) * num_corners,
+        ).reshape(-1, num_corners)
+        counts = np.pad(counts, ((0, len(batch_counts) - len(counts)), (0, 0))) + batch_counts
+        if keep_games:
+            games.append(batch_games)
+        batch.clear()
+
+    for teams in schedule:
+        assert len(teams) % num_corners == 0
+        batch.extend(team_ids.setdefault(x, len(team_ids)) for x in teams)
+        if len(batch) >= _BATCH_SIZE:
+            flush()
+    flush()
+
+    return CornerCounts(
+        list(team_ids),
+        counts,
+        np.concatenate(games) if keep_games else None,
+    )
 
-    for matches in schedule:
-        for teams_this_match in matches:
-            for corner, team_id in enumerate(teams_this_match):
-                teams[team_id][corner] += 1
 
-    for team_id in teams_to_ignore:
-        del teams[team_id]
+def simulate_std_devs(
+    games: npt.NDArray[np.int64],
+    num_teams: int,
+    iterations: int,
+    rng: np.random.Generator,
+) -> npt.NDArray[np.float64]:
+    """
+    Simulate randomly shuffling the teams within each game, returning each
+    team's standard deviation of corner counts for each simulation as an
+    iterations x team array.
+    """
+    num_games, num_corners = games.shape
+    results = []
 
-    return teams
+    batch_size = max(1, _SIMULATION_BATCH_SIZE // max(1, num_games * num_corners))
 
+    for lower in range(0, iterations, batch_size):
+        size = min(batch_size, iterations - lower)
 
-def analyse(teams, num_corners):
-    infos = []
-    for team_id, corner_counts in teams.items():
-        counts = list(corner_counts.values())
-        counts += [0] * (num_corners - len(counts))
-        std_dev = standard_deviation(counts)
-        infos.append((std_dev, team_id, corner_counts))
+        # A random permutation of the positions in each game of each simulation
+        order = np.argsort(rng.random((size, num_games, num_corners)), axis=-1)
+        shuffled = np.take_along_axis(
+            np.broadcast_to(games, (size, num_games, num_corners)),
+            order,
+            axis=-1,
+        )
 
-    infos.sort(reverse=True)
-    return infos
+        simulation = np.arange(size).reshape(-1, 1, 1)
+        flat = (simulation * num_teams + shuffled) * num_corners + np.arange(num_corners)
+        counts = np.bincount(
+            flat.ravel(),
+            minlength=size * num_teams * num_corners,
+        ).reshape(size, num_teams, num_corners)
+
+        results.append(std_devs(counts))
+
+    return np.concatenate(results) if results else np.zeros((0, num_teams))
 
 
-def print_info(infos):
-    print(" Team |  Std. Dev. | Corner Counts")
+def print_info(infos, file=None):
+    print(" Team |  Std. Dev. | Corner Counts", file=file)
 
     for std_dev, team_id, corner_counts in infos:
-        print(f"  {team_id:>2}  ", end='|')
-        print(f"{std_dev:>2.3f}".center(12), end='|')
+        print(f"  {team_id:>2}  ", end='|', file=file)
+        print(f"{std_dev:>2.3f}".center(12), end='|', file=file)
 
         for corner in range(4):
             count = corner_counts.get(corner)
@@ -99,14 +189,239 @@ def print_info(infos):
                 count = f"{count:>2}"
             else:
                 count = '  '
-            print(f" {count}", end='')
-        print('')
+            print(f" {count}", end='', file=file)
+        print('', file=file)
+
+
+@dataclasses.dataclass(frozen=True)
+class TeamBaseline:
+    # Of the team's standard deviation, across the random simulations
+    mean: float
+    percentile_95: float
+    # Percentage of the simulations in which the team's standard deviation
+    # was lower than the actual one
+    percentile: float
+
+
+@dataclasses.dataclass(frozen=True)
+class CornersResult:
+    # (std. dev., team, corner -> count), most uneven first
+    infos: list[tuple[float, str, Counter[int]]]
+    # Number of random simulations the baselines are from
+    iterations: int = 0
+    baselines: dict[str, TeamBaseline] = dataclasses.field(default_factory=dict)
+
+    def render(self) -> str:
+        out = io.StringIO()
+        print_info(self.infos, out)
+
+        if self.baselines:
+            print(file=out)
+            print(f"Compared to {self.iterations} random corner assignments:", file=out)
+            print(" Team |  Std. Dev. |   Mean   | 95th %ile | Percentile", file=out)
+            for std_dev, team_id, _ in self.infos:
+                baseline = self.baselines[team_id]
+                print("|".join([
+                    f"  {team_id:>2}  ",
+                    f"{std_dev:>2.3f}".center(12),
+                    f"{baseline.mean:>2.3f}".center(10),
+                    f"{baseline.percentile_95:>2.3f}".center(11),
+                    f"{baseline.percentile:>5.1f}%".center(12),
+                ]), file=out)
+
+        return out.getvalue()
+
+    def metrics(self) -> dict[str, object]:
+        metrics: dict[str, object] = {
+            'std_devs': {team_id: std_dev for std_dev, team_id, _ in self.infos},
+            'corner_counts': {
+                team_id: {str(x): y for x, y in sorted(corner_counts.items())}
+                for _, team_id, corner_counts in self.infos
+            },
+        }
+        if self.baselines:
+            metrics['baseline'] = {
+                'iterations': self.iterations,
+                'teams': {
+                    team_id: dataclasses.asdict(baseline)
+                    for team_id, baseline in self.baselines.items()
+                },
+            }
+        return metrics
+
+
+def _baselines(
+    corner_counts: CornerCounts,
+    iterations: int,
+    seed: int | None,
+) -> dict[str, TeamBaseline]:
+    assert corner_counts.games is not None
+
+    simulated = simulate_std_devs(
+        corner_counts.games,
+        len(corner_counts.teams),
+        iterations,
+        np.random.default_rng(seed),
+    )
+    actual = corner_counts.std_devs
 
+    means = simulated.mean(axis=0)
+    percentiles_95 = np.percentile(simulated, 95, axis=0)
+    percentiles = (simulated < actual).mean(axis=0) * 100
 
-def shuffle_all(schedule):
-    for matches in schedule:
-        for teams in matches:
-            random.shuffle(teams)
+    return {
+        team_id: TeamBaseline(
+            float(means[idx]),
+            float(percentiles_95[idx]),
+            float(percentiles[idx]),
+        )
+        for idx, team_id in enumerate(corner_counts.teams)
+    }
+
+
+def analyse(
+    context: AnalysisContext,
+    num_corners: int = _DEFAULT_NUM_CORNERS,
+    ignore_ids: Sequence[int] = (),
+    baseline: int = 0,
+    seed: int | None = None,
+) -> CornersResult:
+    corner_counts = count_corners(
+        context.iter_schedule(),
+        num_corners,
+        keep_games=baseline > 0,
+    )
+    teams_to_ignore = {str(x) for x in ignore_ids}
+
+    infos = [
+        (float(std_dev), team_id, Counter({x: int(y) for x, y in enumerate(counts) if y}))
+        for team_id, std_dev, counts in zip(
+            corner_counts.teams,
+            corner_counts.std_devs,
+            corner_counts.counts,
+        )
+        if team_id not in teams_to_ignore
+    ]
+    assert infos, "Schedule file was empty!"
+    infos.sort(reverse=True)
+
+    baselines = {}
+    if baseline > 0:
+        baselines = {
+            team_id: team_baseline
+            for team_id, team_baseline in _baselines(corner_counts, baseline, seed).items()
+            if team_id not in teams_to_ignore
+        }
+
+    return CornersResult(infos, baseline, baselines)
+
+
+def _is_better(cost: tuple[float, ...], other: tuple[float, ...]) -> bool:
+    for value, other_value in zip(cost, other):
+        # Ignore differences which are only due to floating point error
+        if math.isclose(value, other_value, abs_tol=1e-12):
+            continue
+        return value < other_value
+    return False
+
+
+class CornerFixer:
+    """
+    Rearranges the teams within each game to even out how often each team is
+    in each corner.
+
+    Each game in turn is given whichever arrangement of its teams minimises
+    the objective, given the arrangements of all the other games, until a
+    whole pass over the schedule makes no improvement. The result is thus
+    never worse than the original arrangement. Games are visited in a random
+    order, seeded for repeatability.
+    """
+
+    def __init__(
+        self,
+        schedule: list[list[list[str]]],
+        num_corners: int,
+        objective: str = _DEFAULT_OBJECTIVE,
+        teams_to_ignore: Iterable[str] = (),
+    ) -> None:
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Unknown objective {objective!r}")
+
+        self.objective = objective
+        self.games = [game for matches in schedule for game in matches]
+
+        # Map team -> count of appearances in each corner
+        self.counts: DefaultDict[str, list[int]] = defaultdict(lambda: [0] * num_corners)
+        for game in self.games:
+            self._update(game, 1)
+
+        for team_id in teams_to_ignore:
+            self.counts.pop(team_id, None)
+
+        self.std_devs = {x: standard_deviation(y) for x, y in self.counts.items()}
+
+    def _update(self, game: Sequence[str], delta: int) -> None:
+        for corner, team_id in enumerate(game):
+            self.counts[team_id][corner] += delta
+
+    def _cost(self, game: Sequence[str], others_max: float) -> tuple[float, ...]:
+        std_devs = [
+            standard_deviation(self.counts[team_id])
+            for team_id in set(game)
+            if team_id in self.std_devs
+        ]
+        if self.objective == OBJECTIVE_MAX:
+            return max(std_devs + [others_max]), sum(std_devs)
+        return (sum(std_devs),)
+
+    def fix_game(self, game: list[str]) -> bool:
+        """
+        Rearrange the teams in a game to best suit the objective, returning
+        whether this was an improvement.
+        """
+        others_max = max(
+            (y for x, y in self.std_devs.items() if x not in game),
+            default=0.0,
+        )
+
+        current_cost = self._cost(game, others_max)
+
+        self._update(game, -1)
+        best_cost, best = current_cost, game
+        for arrangement in permutations(game):
+            self._update(arrangement, 1)
+            cost = self._cost(arrangement, others_max)
+            self._update(arrangement, -1)
+            if _is_better(cost, best_cost):
+                best_cost, best = cost, list(arrangement)
+        self._update(best, 1)
+
+        for team_id in set(game):
+            if team_id in self.std_devs:
+                self.std_devs[team_id] = standard_deviation(self.counts[team_id])
+
+        if best is game:
+            return False
+
+        game[:] = best
+        return True
+
+    def fix(self, rng: random.Random) -> int:
+        """
+        Optimise the corners of every game in place, returning the number of
+        passes over the schedule which made improvements.
+        """
+        games = list(self.games)
+        passes = 0
+
+        while True:
+            rng.shuffle(games)
+            improved = False
+            for game in games:
+                improved |= self.fix_game(game)
+            if not improved:
+                return passes
+            passes += 1
 
 
 def print_schedule(writer, schedule):
@@ -120,19 +435,34 @@ def main(
     num_corners: int = _DEFAULT_NUM_CORNERS,
     ignore_ids: Sequence[int] = (),
     fix: Path | None = None,
+    use_mmap: bool = False,
+    objective: str = _DEFAULT_OBJECTIVE,
+    seed: int | None = None,
+    baseline: int = 0,
 ) -> None:
-    schedule = load_schedule(schedule_file, num_corners)
-    assert schedule, "Schedule file was empty!"
-
-    teams = convert(schedule, ignore_ids)
-
-    infos = analyse(teams, num_corners)
-    print_info(infos)
+    # Only statistics are needed for the analysis, which are gathered in a
+    # single pass over the schedule.
+    result = analyse(
+        AnalysisContext(schedule_file, use_mmap=use_mmap),
+        num_corners,
+        ignore_ids,
+        baseline=baseline,
+        seed=seed,
+    )
+    print(result.render(), end='')
 
     if not fix:
         return
 
-    shuffle_all(schedule)
+    schedule = load_schedule(schedule_file, num_corners)
+
+    fixer = CornerFixer(
+        schedule,
+        num_corners,
+        objective,
+        teams_to_ignore=[str(x) for x in ignore_ids],
+    )
+    fixer.fix(random.Random(seed))
 
     with open(fix, 'w') as f:
         print_schedule(f, schedule)
@@ -145,7 +475,7 @@ def ignore_ids_type(value: str) -> Sequence[int]:
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         "Displays statistics about how often a team is in a given corner and "
-        "optionally produces a schedule with randomized corners",
+        "optionally produces a schedule with optimised corners",
     )
     parser.add_argument(
         '-i',
@@ -165,10 +495,43 @@ def parse_args() -> argparse.Namespace:
         metavar='destination',
         type=Path,
         help=(
-            "Randomize corner assignment within each match and output a new schedule "
+            "Optimise corner assignment within each match and output a new schedule "
             "to the given file."
         ),
     )
+    parser.add_argument(
+        '--objective',
+        choices=OBJECTIVES,
+        default=_DEFAULT_OBJECTIVE,
+        help=(
+            "Whether fixing should minimise the total or the largest of the teams' "
+            "standard deviations (default: %(default)s)."
+        ),
+    )
+    parser.add_argument(
+        '--baseline',
+        metavar='N',
+        type=int,
+        default=0,
+        help=(
+            "Compare each team's standard deviation against those from N random "
+            "corner assignments."
+        ),
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help=(
+            "Seed for the random corner assignments of the baseline and the order "
+            "in which fixing visits the games."
+        ),
+    )
+    parser.add_argument(
+        '--mmap',
+        dest='use_mmap',
+        action='store_true',
+        help="Memory-map the schedule file rather than reading it.",
+    )
     parser.add_argument('schedule_file', type=Path, help="schedule to examine")
 
     return parser.parse_args()
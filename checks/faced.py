@@ -2,15 +2,20 @@
 
 from __future__ import annotations
 
+import io
 import argparse
+import functools
 import collections
 import dataclasses
-from typing import Counter, Collection, DefaultDict
+from typing import Counter, Collection
 from pathlib import Path
 
+import numpy as np
 import helpers
+import numpy.typing as npt
+from analysis import FacingMatrix, AnalysisContext
 
-TLA = str
+TLA = helpers.Team
 
 _DEFAULT_VERBOSE = False
 
@@ -31,9 +36,8 @@ class TeamFacings:
         *,
         lots_repeats_limit: int,
     ) -> TeamFacings:
-        missed = all_teams - opponents.keys()
+        missed = all_teams - opponents.keys() - {tla}
 
-        del opponents[tla]
         lots_repeats = collections.Counter({
             opp: times
             for opp, times in opponents.items()
@@ -55,75 +59,142 @@ class TeamFacings:
     def repeats(self) -> dict[TLA, int]:
         return {x: y for x, y in self.opponents.items() if y > 1}
 
-    def sort_key(self) -> tuple[int, helpers.HumanSortTuple]:
-        return -len(self.lots_repeats), helpers.human_sort_key(self.tla)
-
 
 def join(values: Collection[str]) -> str:
     return ','.join(sorted(values))
 
 
-def main(schedule_file: Path, verbose: bool = _DEFAULT_VERBOSE) -> None:
-    matches = []
-    lines = helpers.load_lines(schedule_file)
-    for line in lines:
-        players = line.split(helpers.SEPARATOR)
-        while len(players) > 4:
-            matches.append(players[0:4])
-            players = players[4:]
-        matches.append(players[0:4])
+@dataclasses.dataclass(frozen=True)
+class FacingsResult:
+    matrix: FacingMatrix
+    lots_repeats_limit: int
+
+    @functools.cached_property
+    def num_faced(self) -> npt.NDArray[np.int64]:
+        num_faced: npt.NDArray[np.int64] = (self.matrix.counts > 0).sum(axis=1)
+        return num_faced
+
+    @functools.cached_property
+    def num_missed(self) -> npt.NDArray[np.int64]:
+        return len(self.matrix.teams) - 1 - self.num_faced
+
+    @functools.cached_property
+    def num_repeats(self) -> npt.NDArray[np.int64]:
+        num_repeats: npt.NDArray[np.int64] = (self.matrix.counts > 1).sum(axis=1)
+        return num_repeats
+
+    @functools.cached_property
+    def num_lots_repeats(self) -> npt.NDArray[np.int64]:
+        num_lots: npt.NDArray[np.int64] = (self.matrix.counts > self.lots_repeats_limit).sum(axis=1)
+        return num_lots
+
+    def sorted_team_ids(self) -> list[int]:
+        teams = self.matrix.teams
+        return sorted(
+            range(len(teams)),
+            key=lambda x: (-self.num_lots_repeats[x], helpers.human_sort_key(teams[x])),
+        )
 
-    c: DefaultDict[str, Counter[str]] = collections.defaultdict(collections.Counter)
+    def worst_repeat(self, team_id: int) -> tuple[TLA, int]:
+        """
+        The opponent this team faces most, preferring the one it faced first.
+        """
+        counts = self.matrix.counts[team_id]
+        most = counts.max()
+        candidates = np.flatnonzero(counts == most)
+        first = candidates[np.argmin(self.matrix.first_faced[team_id, candidates])]
+        return self.matrix.teams[first], int(most)
+
+    def team_facings(self, team_id: int) -> TeamFacings:
+        matrix = self.matrix
+        counts = matrix.counts[team_id]
+
+        faced = np.flatnonzero(counts)
+        faced = faced[np.argsort(matrix.first_faced[team_id, faced], kind='stable')]
+        opponents = collections.Counter({
+            matrix.teams[x]: int(counts[x])
+            for x in faced
+        })
 
-    for match in matches:
-        for tla in match:
-            for faces in match:
-                c[tla][faces] += 1
+        return TeamFacings.build(
+            matrix.teams[team_id],
+            opponents,
+            set(matrix.teams),
+            lots_repeats_limit=self.lots_repeats_limit,
+        )
 
-    all_teams = set(c.keys())
+    def render(self, verbose: bool = _DEFAULT_VERBOSE) -> str:
+        out = io.StringIO()
+
+        for team_id in self.sorted_team_ids():
+            if verbose:
+                team_facing = self.team_facings(team_id)
+                tla = team_facing.tla
+                faced = team_facing.faced
+                all_repeats = team_facing.repeats
+                lots_repeats = team_facing.lots_repeats
+                missed = team_facing.missed
+
+                print(f"{tla} faces {len(faced)} opponents: {join(faced)}", file=out)
+                print(f"{tla} repeats {len(all_repeats)} opponents: {all_repeats}", file=out)
+                print(
+                    f"{tla} repeats {len(lots_repeats)} opponents lots of times: {lots_repeats}",
+                    file=out,
+                )
+                print(f"{tla} misses {len(missed)} opponents: {join(missed)}", file=out)
+                print(file=out)
+            else:
+                tla = self.matrix.teams[team_id]
+                num_lots_repeats = self.num_lots_repeats[team_id]
+                print(
+                    f"{tla: <4} faces {self.num_faced[team_id]: >2}, "
+                    f"misses {self.num_missed[team_id]: >2}, "
+                    f"repeats {num_lots_repeats: >2} more than {self.lots_repeats_limit} times",
+                    end="",
+                    file=out,
+                )
+                if num_lots_repeats > 1:
+                    worst, count = self.worst_repeat(team_id)
+                    if count > 10:
+                        print(f" (including {worst} {count} times)", end="", file=out)
+                print(file=out)
+
+        return out.getvalue()
+
+    def metrics(self) -> dict[str, object]:
+        counts = self.matrix.counts
+        most_repeats = counts.max(axis=1, initial=0)
+        return {
+            'lots_repeats_limit': self.lots_repeats_limit,
+            'teams': {
+                tla: {
+                    'faced': int(self.num_faced[team_id]),
+                    'missed': int(self.num_missed[team_id]),
+                    'repeats': int(self.num_repeats[team_id]),
+                    'lots_repeats': int(self.num_lots_repeats[team_id]),
+                    'most_repeats': int(most_repeats[team_id]),
+                }
+                for team_id, tla in enumerate(self.matrix.teams)
+            },
+        }
+
+
+def analyse(context: AnalysisContext) -> FacingsResult:
+    matrix = context.facings
 
     # total appearances / teams => max appearances per team
     # 4.0 is teams-per-match
-    matches_per_team = int(round(len(matches) * 4.0 / len(all_teams)))
+    matches_per_team = int(round(matrix.num_games * 4.0 / len(matrix.teams)))
 
     # 4.0 means this is 1/4 of a team's matches
-    LOTS_REPEATS_LIMIT = int(round(matches_per_team / 4.0))
+    lots_repeats_limit = int(round(matches_per_team / 4.0))
 
-    facings = [
-        TeamFacings.build(
-            tla,
-            opponents,
-            all_teams,
-            lots_repeats_limit=LOTS_REPEATS_LIMIT,
-        )
-        for tla, opponents in c.items()
-    ]
-
-    for team_facing in sorted(facings, key=lambda x: x.sort_key()):
-        tla = team_facing.tla
-        faced = team_facing.faced
-        all_repeats = team_facing.repeats
-        lots_repeats = team_facing.lots_repeats
-        missed = team_facing.missed
-
-        if verbose:
-            print(f"{tla} faces {len(faced)} opponents: {join(faced)}")
-            print(f"{tla} repeats {len(all_repeats)} opponents: {all_repeats}")
-            print(f"{tla} repeats {len(lots_repeats)} opponents lots of times: {lots_repeats}")
-            print(f"{tla} misses {len(missed)} opponents: {join(missed)}")
-            print()
-        else:
-            print(
-                f"{tla: <4} faces {len(faced): >2}, "
-                f"misses {len(missed): >2}, "
-                f"repeats {len(lots_repeats): >2} more than {LOTS_REPEATS_LIMIT} times",
-                end="",
-            )
-            if len(lots_repeats) > 1:
-                worst, count = lots_repeats.most_common(1)[0]
-                if count > 10:
-                    print(f" (including {worst} {count} times)", end="")
-            print()
+    return FacingsResult(matrix, lots_repeats_limit)
+
+
+def main(schedule_file: Path, verbose: bool = _DEFAULT_VERBOSE) -> None:
+    result = analyse(AnalysisContext(schedule_file))
+    print(result.render(verbose), end='')
 
 
 def parse_args() -> argparse.Namespace:
@@ -1,29 +1,67 @@
 #!/usr/bin/env python3
 
+import io
 import argparse
 import collections
+import dataclasses
+from typing import Sequence
 from pathlib import Path
 
 import helpers
+from helpers import Team
+from analysis import AnalysisContext
 
 
-def main(schedule_file: Path) -> None:
-    schedule = helpers.load_schedule(schedule_file)
+@dataclasses.dataclass(frozen=True)
+class FeasibilityResult:
+    # (match number, teams) for matches with a team appearing more than once
+    bad_matches: list[tuple[int, Sequence[Team]]]
 
+    @staticmethod
+    def affected(teams: Sequence[Team]) -> list[Team]:
+        return [x for x, y in collections.Counter(teams).items() if y > 1]
+
+    def render(self) -> str:
+        if not self.bad_matches:
+            return 'Is valid\n'
+
+        out = io.StringIO()
+        print("WARNING: Some matches contain two concurrent appearances for the same team:", file=out)
+        print(file=out)
+        for match_num, teams in self.bad_matches:
+            affected = self.affected(teams)
+            print(
+                f"{match_num}: {helpers.SEPARATOR.join(teams)}  # Affected: {', '.join(affected)}",
+                file=out,
+            )
+        return out.getvalue()
+
+    def metrics(self) -> dict[str, object]:
+        return {
+            'valid': not self.bad_matches,
+            'issues': [
+                {
+                    'match': match_num,
+                    'teams': list(teams),
+                    'affected': self.affected(teams),
+                }
+                for match_num, teams in self.bad_matches
+            ],
+        }
+
+
+def analyse(context: AnalysisContext) -> FeasibilityResult:
     bad_matches = [
         (match_num, teams)
-        for match_num, teams in enumerate(schedule)
+        for match_num, teams in enumerate(context.iter_schedule())
         if len(set(teams)) != len(teams)
     ]
+    return FeasibilityResult(bad_matches)
+
 
-    if bad_matches:
-        print("WARNING: Some matches contain two concurrent appearances for the same team:")
-        print()
-        for match_num, teams in bad_matches:
-            affected = [x for x, y in collections.Counter(teams).items() if y > 1]
-            print(f"{match_num}: {helpers.SEPARATOR.join(teams)}  # Affected: {', '.join(affected)}")
-    else:
-        print('Is valid')
+def main(schedule_file: Path, use_mmap: bool = False) -> None:
+    result = analyse(AnalysisContext(schedule_file, use_mmap=use_mmap))
+    print(result.render(), end='')
 
 
 def parse_args() -> argparse.Namespace:
@@ -31,6 +69,12 @@ def parse_args() -> argparse.Namespace:
         "Checks that teams only appear once per match (i.e: row) of the schedule."
     ))
     parser.add_argument('schedule_file', type=Path, help="File to check")
+    parser.add_argument(
+        '--mmap',
+        dest='use_mmap',
+        action='store_true',
+        help="Memory-map the schedule file rather than reading it",
+    )
     return parser.parse_args()
 
 
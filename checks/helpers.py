@@ -1,9 +1,19 @@
 from __future__ import annotations
 
+import io
+import os
 import re
-from typing import Tuple, Union, NewType
+import abc
+import sys
+import mmap
+import array
+import bisect
+import struct
+import hashlib
+import collections
+from typing import Tuple, Union, NewType, Optional, DefaultDict
 from pathlib import Path
-from collections.abc import Sequence
+from collections.abc import Iterable, Iterator, Sequence
 
 HumanSortTuple = Tuple[Union[str, int], ...]
 
@@ -14,30 +24,378 @@ Schedule = Sequence[Sequence[Team]]
 COMMENT_CHAR = '#'
 SEPARATOR = '|'
 
+# Parsed schedules are cached on disk, keyed by the content of the file. The
+# cache can be moved with the first variable and resized (or disabled, with a
+# size of zero) with the second.
+CACHE_DIR_ENV = 'LEAGUE_CHECKER_CACHE_DIR'
+CACHE_SIZE_ENV = 'LEAGUE_CHECKER_CACHE_SIZE'
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+
+def _read_lines(file_path: Path, use_mmap: bool) -> Iterator[str]:
+    if not use_mmap:
+        with open(file_path) as f:
+            yield from f
+        return
+
+    with open(file_path, 'rb') as f:
+        # Empty files can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line in iter(mapped.readline, b''):
+                yield line.decode()
+
+
+def iter_lines(file_path: Path, *, use_mmap: bool = False) -> Iterator[str]:
+    """
+    Lazily yield the non-empty lines of a schedule file, without comments.
+
+    With `use_mmap` the file is memory-mapped rather than read through a file
+    buffer, leaving the paging of large files to the operating system.
+    """
+    yield from _clean_lines(_read_lines(file_path, use_mmap))
+
+
+def _clean_lines(lines: Iterable[str]) -> Iterator[str]:
+    for line in lines:
+        text = line.split(COMMENT_CHAR, 1)[0].strip()
+        if text:
+            yield text
+
 
 def load_lines(file_path: Path) -> list[str]:
-    lines = []
-    with open(file_path) as f:
-        for line in f.readlines():
-            text = line.split(COMMENT_CHAR, 1)[0].strip()
-            if text:
-                lines.append(text)
+    return list(iter_lines(file_path))
 
-    return lines
 
+def parse_match(line: str) -> tuple[Team, ...]:
+    return tuple(
+        Team(t)
+        for t in line.split(SEPARATOR)
+    )
 
-def parse_schedule(lines: list[str]) -> Schedule:
-    return [
-        tuple(
-            Team(t)
-            for t in x.split(SEPARATOR)
-        )
-        for x in lines
-    ]
+
+def parse_schedule(lines: Iterable[str]) -> Schedule:
+    return [parse_match(x) for x in lines]
+
+
+def iter_schedule(file_path: Path, *, use_mmap: bool = False) -> Iterator[tuple[Team, ...]]:
+    """
+    Lazily yield the matches of a schedule file, so that checks which only
+    need a single pass over the schedule use constant memory.
+    """
+    for line in iter_lines(file_path, use_mmap=use_mmap):
+        yield parse_match(line)
 
 
 def load_schedule(file_path: Path) -> Schedule:
-    return parse_schedule(load_lines(file_path))
+    return list(iter_schedule(file_path))
+
+
+class InternedSchedule:
+    """
+    A schedule whose teams have been interned into dense integer ids.
+
+    Matches are stored in a single flat array of fixed-width rows, padded with
+    `EMPTY` where a match has fewer teams than the largest. The `teams` table
+    maps ids back to team names for output. Views of the schedule are built
+    lazily and then shared.
+    """
+
+    EMPTY = -1
+
+    __slots__ = (
+        'teams',
+        'team_ids',
+        'width',
+        'data',
+        '_appearances',
+    )
+
+    # Magic, format version, byte order, number of teams, width, number of
+    # matches and the length of the name table. The size keeps the data which
+    # follows aligned.
+    _HEADER = struct.Struct('<4sBBxxIIII')
+    _MAGIC = b'LCIS'
+    _VERSION = 1
+    _BYTE_ORDER = {'little': 0, 'big': 1}[sys.byteorder]
+
+    def __init__(self, teams: Sequence[Team], width: int, data: Sequence[int]) -> None:
+        self.teams = tuple(teams)
+        self.team_ids = {x: idx for idx, x in enumerate(self.teams)}
+        self.width = width
+        self.data = data
+
+        self._appearances: Optional[list[list[int]]] = None
+
+    @classmethod
+    def from_schedule(cls, schedule: Schedule) -> InternedSchedule:
+        """
+        Intern a schedule, assigning ids to teams in order of first appearance.
+        """
+        team_ids: dict[Team, int] = {}
+        width = max((len(x) for x in schedule), default=0)
+        data = array.array('i', [cls.EMPTY]) * (width * len(schedule))
+
+        for match_num, match in enumerate(schedule):
+            offset = match_num * width
+            for position, team in enumerate(match):
+                data[offset + position] = team_ids.setdefault(team, len(team_ids))
+
+        return cls(list(team_ids), width, data)
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialise the schedule into a compact binary form, suitable for
+        loading back with `from_buffer`.
+        """
+        names = '\n'.join(self.teams).encode()
+        names += b'\0' * (-len(names) % array.array('i').itemsize)
+        header = self._HEADER.pack(
+            self._MAGIC,
+            self._VERSION,
+            self._BYTE_ORDER,
+            len(self.teams),
+            self.width,
+            len(self),
+            len(names),
+        )
+        return header + names + array.array('i', self.data).tobytes()
+
+    @classmethod
+    def from_buffer(cls, buffer: memoryview) -> InternedSchedule:
+        """
+        Load a schedule serialised by `to_bytes`. The match data is used in
+        place rather than being copied, so the buffer can be memory-mapped.
+        """
+        (
+            magic,
+            version,
+            byte_order,
+            num_teams,
+            width,
+            num_matches,
+            names_length,
+        ) = cls._HEADER.unpack_from(buffer)
+        if (magic, version, byte_order) != (cls._MAGIC, cls._VERSION, cls._BYTE_ORDER):
+            raise ValueError("Not a serialised schedule in a supported format")
+
+        offset = cls._HEADER.size
+        names = bytes(buffer[offset:offset + names_length]).rstrip(b'\0').decode()
+        teams = [Team(x) for x in names.split('\n')] if num_teams else []
+        if len(teams) != num_teams:
+            raise ValueError("Serialised schedule has a corrupt name table")
+
+        data = buffer[offset + names_length:]
+        # Check the length before casting, which fails on partial items
+        if len(data) != width * num_matches * array.array('i').itemsize:
+            raise ValueError("Serialised schedule has corrupt match data")
+
+        return cls(teams, width, data.cast('i'))
+
+    @property
+    def num_teams(self) -> int:
+        return len(self.teams)
+
+    def __len__(self) -> int:
+        return len(self.data) // self.width if self.width else 0
+
+    def __getitem__(self, match_num: int) -> tuple[int, ...]:
+        if not 0 <= match_num < len(self):
+            raise IndexError(match_num)
+        offset = match_num * self.width
+        return tuple(
+            x
+            for x in self.data[offset:offset + self.width]
+            if x != self.EMPTY
+        )
+
+    def __iter__(self) -> Iterator[tuple[int, ...]]:
+        for match_num in range(len(self)):
+            yield self[match_num]
+
+    def names(self, match: Iterable[int]) -> tuple[Team, ...]:
+        return tuple(self.teams[x] for x in match)
+
+    @property
+    def appearances(self) -> Sequence[Sequence[int]]:
+        """
+        The match numbers each team appears in, in order, indexed by team id.
+        """
+        if self._appearances is None:
+            appearances: list[list[int]] = [[] for _ in self.teams]
+            for match_num, match in enumerate(self):
+                for team_id in match:
+                    appearances[team_id].append(match_num)
+            self._appearances = appearances
+        return self._appearances
+
+
+class ScheduleCache:
+    """
+    An on-disk cache of interned schedules, keyed by a hash of the content of
+    the file they were parsed from.
+
+    Entries are memory-mapped when loaded. Once the total size of the cache
+    exceeds `max_size` the least recently used entries are removed. The cache
+    is best effort: any problems reading or writing it are ignored.
+    """
+
+    SUFFIX = '.schedule'
+
+    def __init__(self, directory: Path, max_size: int) -> None:
+        self.directory = directory
+        self.max_size = max_size
+
+    @classmethod
+    def from_environment(cls) -> Optional[ScheduleCache]:
+        try:
+            max_size = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+        except ValueError:
+            max_size = DEFAULT_CACHE_SIZE
+        if max_size <= 0:
+            return None
+
+        directory = os.environ.get(CACHE_DIR_ENV)
+        if directory:
+            return cls(Path(directory), max_size)
+
+        cache_home = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+        return cls(Path(cache_home) / 'league-checker', max_size)
+
+    @staticmethod
+    def key(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / (key + self.SUFFIX)
+
+    def get(self, key: str) -> Optional[InternedSchedule]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            schedule = InternedSchedule.from_buffer(memoryview(mapped))
+        except OSError:
+            return None
+        except (ValueError, struct.error):
+            # Remove the corrupt entry so that it's replaced
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                pass
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return schedule
+
+    def put(self, key: str, schedule: InternedSchedule) -> None:
+        path = self._path(key)
+        # Write then rename so that concurrent readers never see a partial file
+        tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp.write_bytes(schedule.to_bytes())
+            os.replace(tmp, path)
+            self._evict()
+        except OSError:
+            return
+        finally:
+            try:
+                tmp.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+    def _evict(self) -> None:
+        entries = []
+        # Includes any temporary files left by writers which didn't finish
+        for path in self.directory.glob('*' + self.SUFFIX + '*'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def load_interned_schedule(file_path: Path) -> InternedSchedule:
+    """
+    Load a schedule file as an interned schedule, via the schedule cache if it
+    is enabled.
+    """
+    cache = ScheduleCache.from_environment()
+    if cache is None:
+        return InternedSchedule.from_schedule(list(iter_schedule(file_path)))
+
+    content = Path(file_path).read_bytes()
+    key = cache.key(content)
+
+    schedule = cache.get(key)
+    if schedule is not None:
+        return schedule
+
+    lines = _clean_lines(io.StringIO(content.decode(), newline=None))
+    schedule = InternedSchedule.from_schedule([parse_match(x) for x in lines])
+    cache.put(key, schedule)
+    return schedule
+
+
+class GapIndex(abc.ABC):
+    """
+    Where each team appears in a schedule, kept up to date as teams are
+    inserted into and removed from matches. Subclasses are told about each gap
+    between consecutive appearances of a team as it is added or removed, so
+    can track whatever they need about the gaps without rescanning.
+    """
+
+    def __init__(self) -> None:
+        # Map TLA -> (zero-based) numbers of the matches it appears in, sorted
+        self.appearances: DefaultDict[Team, list[int]] = collections.defaultdict(list)
+
+    @abc.abstractmethod
+    def _add_gap(self, tla: Team, gap: int) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _remove_gap(self, tla: Team, gap: int) -> None:
+        raise NotImplementedError
+
+    def _insert(self, tla: Team, position: int) -> None:
+        positions = self.appearances[tla]
+        idx = bisect.bisect_left(positions, position)
+        if idx > 0:
+            before = positions[idx - 1]
+            self._add_gap(tla, position - before)
+        if idx < len(positions):
+            after = positions[idx]
+            self._add_gap(tla, after - position)
+            if idx > 0:
+                self._remove_gap(tla, after - before)
+        positions.insert(idx, position)
+
+    def _remove(self, tla: Team, position: int) -> None:
+        positions = self.appearances[tla]
+        idx = bisect.bisect_left(positions, position)
+        del positions[idx]
+        if idx > 0:
+            before = positions[idx - 1]
+            self._remove_gap(tla, position - before)
+        if idx < len(positions):
+            after = positions[idx]
+            self._remove_gap(tla, after - position)
+            if idx > 0:
+                self._add_gap(tla, after - before)
 
 
 def human_sort_key(text: str) -> HumanSortTuple:
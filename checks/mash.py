@@ -1,418 +1,705 @@
 #!/usr/bin/env python3
 
 import sys
+import heapq
 import argparse
+import operator
 import itertools
 import collections
+import concurrent.futures
 from typing import (
-    Set,
+    List,
     Tuple,
     Counter,
     Mapping,
     Iterable,
+    Iterator,
+    Optional,
     Sequence,
     FrozenSet,
     Collection,
+    NamedTuple,
     DefaultDict,
 )
-from functools import cmp_to_key
+from pathlib import Path
 
 import helpers
 
-ap = argparse.ArgumentParser(
-    description="Identify teams that can be swapped between games inside matches",
-)
-ap.add_argument(
-    "infile",
-    help="Input schedule",
-)
-ap.add_argument(
-    "matchno",
-    type=int,
-    help="Which match number to fiddle with",
-)
-ap.add_argument(
-    "--auto-alter",
-    action="store_true",
-    help="Print the schedule with specified match patched",
-)
-ap.add_argument(
-    "--multimatch",
-    action="store_true",
-    help="Consider swapping teams between this and the next match",
-)
-ap.add_argument(
-    "--matches",
-    type=int,
-    default=0,
-    help="Number of matches in each round",
-)
-ap.add_argument(
-    "--closeness",
-    type=int,
-    default=0,
-    help="Closeness criteria",
-)
-
-args = ap.parse_args()
-
-if args.multimatch and (args.matches == 0 or args.closeness == 0):
-    print("Matches and closeness options required for doing multimatch calcs", file=sys.stderr)
-    sys.exit(1)
-
-if args.multimatch and ((args.matchno + 1) % args.matches) == 0:
-    print("Can't multi-match schedule over round boundaries, skipping this one", file=sys.stderr)
-    args.multimatch = False
+Game = FrozenSet[str]
+Match = Tuple[Game, ...]
 
-with open(args.infile) as f:
-    lines = [x.strip() for x in f]
+# The magnitudes of repeats which happen, in reducing magnitude, and the
+# number of times each happens. See `score_key`.
+ScoreKey = Tuple[Tuple[int, ...], Tuple[int, ...]]
 
-matches = [
-    line.split(helpers.SEPARATOR)
-    for line in lines
-    if line and line[0] != helpers.COMMENT_CHAR
-]
+DEFAULT_GAME_SIZE = 4
 
 # Map TLA -> TLA -> count
-facing_counts: DefaultDict[str, Counter[str]] = collections.defaultdict(collections.Counter)
+FacingCounts = DefaultDict[str, Counter[str]]
 
 
-def calc_faced_in_game(
-    game: Collection[str],
-    container: DefaultDict[str, Counter[str]],
-    sub: bool,
-) -> None:
-    for tla in game:
-        for faces in game:
-            if sub:
-                container[tla][faces] -= 1
-            else:
-                container[tla][faces] += 1
-
-
-def calc_faced_in_match(
-    match: Sequence[str],
-    container: DefaultDict[str, Counter[str]],
-    sub: bool = False,
-) -> None:
-    while len(match) > 4:
-        calc_faced_in_game(match[0:4], container, sub)
-        match = match[4:]
-    calc_faced_in_game(match, container, sub)
-
-
-# Calculate how many times each team faces each other, except in the selected
-# match
-cur_match_no = 0
-forward_matches = []
-middle_idx = 0
-for match in matches:
-    if cur_match_no == args.matchno:
-        cur_match_no += 1
-        continue
-    elif args.multimatch and cur_match_no == args.matchno + 1:
-        # Store earlier matches for checking closeness criteria
-        middle_idx = cur_match_no - 1
-        firstidx = max(0, middle_idx - args.closeness)
-        forward_matches = matches[firstidx:middle_idx]
+class bcolours:
+    HEADER = '\033[95m'
+    OKBLUE = '\033[94m'
+    OKGREEN = '\033[92m'
+    WARNING = '\033[93m'
+    FAIL = '\033[91m'
+    ENDC = '\033[0m'
 
-        cur_match_no += 1
-        continue
 
-    calc_faced_in_match(match, facing_counts)
-    cur_match_no += 1
+def load_lines(file_path: Path) -> List[str]:
+    with open(file_path) as f:
+        return [x.strip() for x in f]
 
-num_after_matches = min(middle_idx + 2 + args.closeness, len(matches))
-after_matches = matches[middle_idx + 2:num_after_matches]
 
-# Calculate the teams who'll conflict with players in our matches in multimatch
-# mode
+def parse_matches(lines: Iterable[str]) -> List[List[str]]:
+    return [
+        list(helpers.parse_match(line))
+        for line in lines
+        if line and line[0] != helpers.COMMENT_CHAR
+    ]
 
-forward_teams = frozenset(itertools.chain.from_iterable(forward_matches))
-after_teams = frozenset(itertools.chain.from_iterable(after_matches))
 
-all_teams = set(facing_counts.keys())
+def split_games(
+    match: Sequence[str],
+    game_size: int = DEFAULT_GAME_SIZE,
+) -> List[Sequence[str]]:
+    games = []
+    while len(match) > game_size:
+        games.append(match[0:game_size])
+        match = match[game_size:]
+    games.append(match)
+    return games
 
 
-def calc_scoring(sched: DefaultDict[str, Counter[str]]) -> Mapping[int, int]:
+class FacingTable:
     """
-    Calculate a dictionary of how many times repeats happen: the size of the
-    repeat maps to the number of times it happens. Due to an artifact of how
-    this is counted, the "number of times" is twice as large as reality
-    """
-    # Something involving defaults would be better, but requires thought
-    output = dict.fromkeys(range(len(matches)), 0)
-
-    for tla, opponents in sched.items():
-        del opponents[tla]
-        faced = opponents.keys()
-        for opp in faced:
-            times = opponents[opp]
-            if times == 0:
-                continue
-
-            output[times] += 1
-
-    # Remove repeats with zero count
-    for i in list(output.keys()):
-        if output[i] == 0:
-            del output[i]
-
-    return output
+    How many times each team faces each other team, along with a live
+    histogram of the magnitudes of those repeats.
 
+    The histogram maps the size of a repeat to the number of times it
+    happens. As each pair of teams is counted from both sides, the "number of
+    times" is twice as large as reality. Adding or removing a game only
+    touches the pairs within that game.
+    """
 
-def scoring_cmp(x: Mapping[int, int], y: Mapping[int, int]) -> int:
+    def __init__(
+        self,
+        matches: Iterable[Sequence[str]] = (),
+        game_size: int = DEFAULT_GAME_SIZE,
+    ) -> None:
+        self.game_size = game_size
+        self.counts: FacingCounts = collections.defaultdict(collections.Counter)
+        self.histogram: Counter[int] = collections.Counter()
+
+        for match in matches:
+            self.add_match(match)
+
+    def _adjust_game(self, game: Collection[str], delta: int) -> None:
+        histogram = self.histogram
+        for tla in game:
+            opponents = self.counts[tla]
+            for faces in game:
+                if faces == tla:
+                    continue
+                old = opponents[faces]
+                new = old + delta
+                opponents[faces] = new
+                if old:
+                    histogram[old] -= 1
+                if new:
+                    histogram[new] += 1
+
+    def add_game(self, game: Collection[str]) -> None:
+        self._adjust_game(game, 1)
+
+    def remove_game(self, game: Collection[str]) -> None:
+        self._adjust_game(game, -1)
+
+    def add_match(self, match: Sequence[str]) -> None:
+        for game in split_games(match, self.game_size):
+            self.add_game(game)
+
+    def remove_match(self, match: Sequence[str]) -> None:
+        for game in split_games(match, self.game_size):
+            self.remove_game(game)
+
+    def match_delta(self, match: Match) -> Counter[int]:
+        """
+        The change to the histogram which adding the given match would make.
+        """
+        delta: Counter[int] = collections.Counter()
+        for game in match:
+            for tla in game:
+                opponents = self.counts[tla]
+                for faces in game:
+                    if faces == tla:
+                        continue
+                    old = opponents[faces]
+                    if old:
+                        delta[old] -= 1
+                    delta[old + 1] += 1
+        return delta
+
+    def score(self, deltas: Iterable[Counter[int]] = ()) -> Mapping[int, int]:
+        """
+        The histogram of repeats, excluding those which don't happen, in
+        increasing magnitude.
+
+        Deltas from `match_delta` for matches which share no teams may be
+        given, in which case the histogram is scored as if they were added.
+        """
+        histogram = self.histogram.copy()
+        for delta in deltas:
+            histogram.update(delta)
+        return {
+            times: histogram[times]
+            for times in sorted(histogram)
+            if histogram[times]
+        }
+
+
+def score_key(score: Mapping[int, int]) -> ScoreKey:
     """
-    Define a comparator about the score a particular match configuration has.
-    A 'better' score is one where the largest magnitude of repeat is less than
+    Define a comparable key for the score a particular match configuration
+    has, where a 'better' score has a lower key.
+
+    A better score is one where the largest magnitude of repeat is less than
     another, i.e. a schedule with some 3-times repeats is better than one with
-    any 4-time repeats.
+    any 4-time repeats. More generally, the magnitudes of repeats which happen
+    are compared in reducing magnitude and the schedule which has a magnitude
+    of repeat that the other doesn't is worse.
     Failing that, the number of repeats is compared, in reducing magnitude, so
     a schedule with 20 3-time repeats is worse than one with 15 of them.
     """
-    xkeys: Collection[int] = x.keys()
-    ykeys: Collection[int] = y.keys()
-
-    if xkeys != ykeys:
-        # One of these dicts has a higher magnitude of repeats than the other.
-        xkeys = sorted(xkeys, reverse=True)
-        ykeys = sorted(ykeys, reverse=True)
-
-        # Find the highest magnitude of repeat
-        highest = 0
-        if xkeys[0] > ykeys[0]:
-            highest = xkeys[0]
-        else:
-            highest = ykeys[0]
-
-        # Decrease from there, finding where which schedule, x or y, has a
-        # magnitude of repeat that the other doesn't
-        for i in reversed(range(highest + 1)):
-            if i in xkeys and i not in ykeys:
-                return -1
-            elif i in ykeys and i not in xkeys:
-                return 1
-        return 0
-    else:
-        # The schedules have the same set of keys: compare the number of times
-        # that each magnitude of repeats occurs
-        xkeys = sorted(xkeys, reverse=True)
-        for i in xkeys:
-            if x[i] < y[i]:
-                return 1
-            elif x[i] > y[i]:
-                return -1
-        return 0
+    magnitudes = sorted(score, reverse=True)
+    return tuple(magnitudes), tuple(score[x] for x in magnitudes)
 
 
-# Select the desired match
-the_teams = matches[int(args.matchno)]
-first_match = frozenset(the_teams)
-if args.multimatch:
-    the_teams = the_teams + matches[args.matchno + 1]
+# Now enumerate the distinct arrangements of the teams in the match(es) being
+# considered. Games are unordered within a match, as are the teams within a
+# game, so each arrangement is generated exactly once.
 
-# Now enumerate the set of unique matches that can be played with the teams
-# in this match, re-ordered. Don't do anything fancy.
 
+def _equal_partitions(teams: Sequence[str], game_size: int) -> Iterator[Match]:
+    if not teams:
+        yield ()
+        return
 
-def get_unique_games(teams: Iterable[str]) -> Set[FrozenSet[str]]:
-    """
-    Generate all possible 4-team combinations via generating all combinations,
-    and canonicalising the order to avoid equivalent orderings being inserted.
-    """
-    unique_games = set()
-
-    for comb in itertools.product(the_teams, repeat=4):
-        # Duplicate members?
-        theset = frozenset(comb)
-        if len(theset) != 4:
-            continue
+    # The first remaining team is always in the next game, which breaks the
+    # symmetry between games of the same size.
+    first, rest = teams[0], teams[1:]
+    for others in itertools.combinations(rest, game_size - 1):
+        game = frozenset((first,) + others)
+        remaining = [x for x in rest if x not in game]
+        for games in _equal_partitions(remaining, game_size):
+            yield (game,) + games
 
-        if theset not in unique_games:
-            unique_games.add(theset)
 
-    return unique_games
+def get_partitions(
+    teams: Iterable[str],
+    game_size: int = DEFAULT_GAME_SIZE,
+) -> Iterator[Match]:
+    """
+    Generate each distinct way of splitting the given teams into games of the
+    given size. Where the teams don't divide evenly the last game is smaller,
+    as when the match is loaded.
+    """
+    teams = sorted(teams)
+    num_short = len(teams) % game_size
 
+    if not num_short:
+        yield from _equal_partitions(teams, game_size)
+        return
 
-unique_games = get_unique_games(the_teams)
+    for short_game in itertools.combinations(teams, num_short):
+        remaining = [x for x in teams if x not in short_game]
+        for games in _equal_partitions(remaining, game_size):
+            yield games + (frozenset(short_game),)
 
 
-def get_unique_matches(
-    unique_games: Set[FrozenSet[str]],
-    multimatch: bool,
-) -> Set[Tuple[FrozenSet[str], FrozenSet[str]]]:
+def get_first_match_teams(
+    first_match: Game,
+    second_match: Game,
+    forward_teams: Game,
+    after_teams: Game,
+) -> Iterator[Game]:
     """
-    Combine the set of unique games into a set of matches. Guard against the same
-    match but in a different order being found.
+    In multimatch mode, generate the sets of teams which could play in the
+    first of the two matches being considered.
+
+    That is either a completely unchanged set of teams from either match, or
+    one with a single pair of teams swapped between the matches. This means we
+    only explore one pair of teams swapping matches, keeping the size of
+    exploration feasible. Sets which would put a team too close to its
+    matches either side of the pair are excluded.
     """
+    all_teams = first_match | second_match
 
-    unique_matches = set()
-    for g1, g2 in itertools.product(unique_games, repeat=2):
-        # Test that we actually have all 8 players playing in this match.
-        if not g1.isdisjoint(g2):
-            continue
-
-        # In multimatch mode, check that the match is either a completely unchanged
-        # set of teams from either match, or only has one team difference. This
-        # means we only explore one pair of teams swapping matches, keeping the size
-        # of exploration feasible.
-        if multimatch:
-            both = g1 | g2
-            inter_first = both & first_match
+    # Build the options in a stable order so that ties between equally good
+    # arrangements always resolve the same way.
+    options = {first_match: None, second_match: None}
+    for a, b in itertools.product(sorted(first_match), sorted(second_match)):
+        options[first_match - {a} | {b}] = None
+        options[second_match - {b} | {a}] = None
 
-            thelen = len(inter_first)
-            if thelen != 0 and thelen != 1 and thelen != 7 and thelen != 8:
-                continue
-
-        if (g2, g1) in unique_matches:
+    for teams in options:
+        if not teams.isdisjoint(forward_teams):
             continue
-        unique_matches.add((g1, g2))
-
-    return unique_matches
-
+        if not after_teams.isdisjoint(all_teams - teams):
+            continue
+        yield teams
 
-unique_matches = get_unique_matches(unique_games, args.multimatch)
 
+def flatten(match: Match) -> List[str]:
+    return [x for game in match for x in game]
 
-# In multimatch mode, turn the unique matches set into a set of match pairs.
-match_pairs = set()
-if args.multimatch:
-    for comb in itertools.product(unique_matches, repeat=2):
-        m1, m2 = comb
-        set1, set2 = m1
-        set3, set4 = m2
-        if len(set1 | set2 | set3 | set4) != 16:
-            continue
 
-        # That's checked uniqueness. Now look for closeness hazards.
-        if len(set3 & after_teams) != 0:
-            continue
-        if len(set4 & after_teams) != 0:
-            continue
-        if len(set1 & forward_teams) != 0:
-            continue
-        if len(set2 & forward_teams) != 0:
-            continue
+class MashResult(NamedTuple):
+    matchno: int
+    score: Mapping[int, int]
+    # One match, or two consecutive ones in multimatch mode
+    matches: Tuple[Match, ...]
 
-        match_pairs.add(comb)
 
-# Now for some actual scoring. For each match, duplicate the scoring dictionary
-# for the rest of the schedule, and add the generated match to that scoring.
+class Candidate(NamedTuple):
+    key: ScoreKey
+    score: Mapping[int, int]
+    # One match per set of teams being arranged
+    matches: Tuple[Match, ...]
 
 
-def add_generated_match_sched(
-    m: Tuple[Iterable[str], Iterable[str]],
-    sched: DefaultDict[str, Counter[str]],
-    sub: bool,
-) -> DefaultDict[str, Counter[str]]:
-    g1, g2 = m
+def _best(candidates: Iterable[Candidate], top: int) -> List[Candidate]:
+    """
+    Find the `top` best candidates, best first, without holding them all in
+    memory. Ties keep the order the candidates were generated in.
+    """
+    return heapq.nsmallest(top, candidates, key=operator.attrgetter('key'))
 
-    calc_faced_in_match(list(g1), sched, sub)
-    calc_faced_in_match(list(g2), sched, sub)
-    return sched
 
+def _score_group(table: FacingTable, group: Sequence[Game]) -> Iterator[Candidate]:
+    """
+    Score each arrangement of the given sets of teams, one set per match,
+    against the rest of the schedule.
 
-scorelist = []
-if not args.multimatch:
-    for m in unique_matches:
-        sched = facing_counts
-        sched = add_generated_match_sched(m, sched, False)
-        score = calc_scoring(sched)
-        sched = add_generated_match_sched(m, sched, True)
+    The matches share no teams, so no pair of teams is in more than one of
+    them. The change each possible match makes to the score is therefore
+    independent of the others and only needs computing once.
+    """
+    options = [
+        [
+            (match, table.match_delta(match))
+            for match in get_partitions(teams, table.game_size)
+        ]
+        for teams in group
+    ]
+    for combination in itertools.product(*options):
+        candidate = tuple(match for match, _ in combination)
+        score = table.score(delta for _, delta in combination)
+        yield Candidate(score_key(score), score, candidate)
+
+
+def _best_in_group(
+    other_matches: Sequence[Sequence[str]],
+    game_size: int,
+    group: Sequence[Game],
+    top: int,
+) -> List[Candidate]:
+    """
+    Find the best arrangements of a group of teams against the rest of the
+    schedule. Used by worker processes, which have no table of their own.
+    """
+    table = FacingTable(other_matches, game_size)
+    return _best(_score_group(table, group), top)
 
-        scorelist.append((score, m))
-else:
-    for m1, m2 in match_pairs:
-        sched = facing_counts
-        sched = add_generated_match_sched(m1, sched, False)
-        sched = add_generated_match_sched(m2, sched, False)
-        score = calc_scoring(sched)
 
-        sched = add_generated_match_sched(m1, sched, True)
-        sched = add_generated_match_sched(m2, sched, True)
-        facing_counts = sched
+class Masher:
+    """
+    Finds the best arrangement of the teams within matches of a schedule.
 
-        scorelist.append((score, (m1, m2)))  # type: ignore[arg-type]
+    The table of how often each team faces each other is built once for the
+    whole schedule. Each match which is re-mashed is removed from the table,
+    its candidate arrangements are scored against the remainder and then the
+    best arrangement is added back, so that later matches are evaluated
+    against the schedule as already improved.
+    """
 
+    def __init__(
+        self,
+        matches: Sequence[Sequence[str]],
+        *,
+        multimatch: bool = False,
+        matches_per_round: int = 0,
+        closeness: int = 0,
+        game_size: int = DEFAULT_GAME_SIZE,
+    ) -> None:
+        self.matches = [list(x) for x in matches]
+        self.multimatch = multimatch
+        self.matches_per_round = matches_per_round
+        self.closeness = closeness
+        self.game_size = game_size
+
+        self.facing_table = FacingTable(self.matches, game_size)
+
+    def can_pair(self, matchno: int) -> bool:
+        if matchno + 1 >= len(self.matches):
+            return False
+        # Can't multi-match schedule over round boundaries
+        return ((matchno + 1) % self.matches_per_round) != 0
+
+    def can_multimatch(self, matchno: int) -> bool:
+        return self.multimatch and self.can_pair(matchno)
+
+    def _groups(self, selected: Sequence[int]) -> List[Tuple[Game, ...]]:
+        """
+        Split the possible arrangements of the selected matches into groups,
+        each of which is the set of teams which play in each match.
+        """
+        if len(selected) == 1:
+            matchno, = selected
+            return [(frozenset(self.matches[matchno]),)]
+
+        matchno = selected[0]
+
+        # Calculate the teams who'll conflict with players in our matches
+        forward_matches = self.matches[max(0, matchno - self.closeness):matchno]
+        after_matches = self.matches[matchno + 2:matchno + 2 + self.closeness]
+        forward_teams = frozenset(itertools.chain.from_iterable(forward_matches))
+        after_teams = frozenset(itertools.chain.from_iterable(after_matches))
+
+        first_match = frozenset(self.matches[matchno])
+        second_match = frozenset(self.matches[matchno + 1])
+        all_teams = first_match | second_match
+        first_options = get_first_match_teams(
+            first_match,
+            second_match,
+            forward_teams,
+            after_teams,
+        )
+        return [(x, all_teams - x) for x in first_options]
+
+    def _find_best(
+        self,
+        selected: Sequence[int],
+        executor: Optional[concurrent.futures.Executor],
+        top: int,
+    ) -> List[Candidate]:
+        groups = self._groups(selected)
+
+        candidates: Iterable[Candidate]
+        if executor is None or len(groups) < 2:
+            candidates = itertools.chain.from_iterable(
+                _score_group(self.facing_table, group)
+                for group in groups
+            )
+        else:
+            other_matches = [
+                match
+                for idx, match in enumerate(self.matches)
+                if idx not in selected
+            ]
+            futures = [
+                executor.submit(_best_in_group, other_matches, self.game_size, group, top)
+                for group in groups
+            ]
+            candidates = itertools.chain.from_iterable(f.result() for f in futures)
+
+        return _best(candidates, top)
+
+    def _rearrange(
+        self,
+        selected: Sequence[int],
+        *,
+        executor: Optional[concurrent.futures.Executor] = None,
+        only_improvements: bool = False,
+        top: int = 1,
+    ) -> List[MashResult]:
+        """
+        Find the `top` best arrangements of the teams in the selected matches,
+        best first, and update the schedule to use the best of them.
+
+        When `only_improvements` is set the schedule is only changed if the
+        best arrangement is strictly better than the current one; otherwise
+        nothing is returned.
+        """
+        table = self.facing_table
+
+        # Calculate how many times each team faces each other, except in the
+        # selected matches
+        for idx in selected:
+            table.remove_match(self.matches[idx])
+
+        best = self._find_best(selected, executor, top)
+
+        if not best or only_improvements:
+            # Nothing may satisfy the closeness constraints, in which case keep
+            # the matches as they are rather than failing part way through.
+            current = tuple(
+                tuple(frozenset(x) for x in split_games(self.matches[idx], self.game_size))
+                for idx in selected
+            )
+            current_score = table.score(table.match_delta(match) for match in current)
+            current_key = score_key(current_score)
+            if not best or best[0].key >= current_key:
+                if only_improvements:
+                    for idx in selected:
+                        table.add_match(self.matches[idx])
+                    return []
+                best = [Candidate(current_key, current_score, current)]
+
+        for idx, match in zip(selected, best[0].matches):
+            self.matches[idx] = flatten(match)
+        for idx in selected:
+            table.add_match(self.matches[idx])
+
+        return [MashResult(selected[0], x.score, x.matches) for x in best]
+
+    def mash(self, matchno: int, top: int = 1) -> List[MashResult]:
+        """
+        Find the `top` best arrangements of the teams in the given match (and
+        the next one, in multimatch mode), best first, and update the schedule
+        to use the best of them.
+        """
+        selected = [matchno, matchno + 1] if self.can_multimatch(matchno) else [matchno]
+        return self._rearrange(selected, top=top)
+
+    def mash_range(self, matchnos: Iterable[int], top: int = 1) -> List[List[MashResult]]:
+        return [self.mash(matchno, top) for matchno in matchnos]
+
+    def sweep(
+        self,
+        executor: Optional[concurrent.futures.Executor] = None,
+    ) -> List[MashResult]:
+        """
+        Try to improve each match, and each adjacent pair of matches within a
+        round, in turn. Returns the improvements which were made.
+        """
+        improvements = []
+        for matchno in range(len(self.matches)):
+            steps = [[matchno]]
+            if self.can_pair(matchno):
+                steps.append([matchno, matchno + 1])
+
+            for selected in steps:
+                improvements += self._rearrange(
+                    selected,
+                    executor=executor,
+                    only_improvements=True,
+                )
+
+        return improvements
+
+    def optimise(
+        self,
+        executor: Optional[concurrent.futures.Executor] = None,
+    ) -> Iterator[List[MashResult]]:
+        """
+        Hill-climb the whole schedule, sweeping over it until a sweep finds no
+        improvement. Yields the improvements made by each sweep.
+        """
+        while True:
+            improvements = self.sweep(executor)
+            yield improvements
+            if not improvements:
+                return
+
+
+def print_result(result: MashResult) -> None:
+    if len(result.matches) == 1:
+        match, = result.matches
+        normalised = "|".join(flatten(match))
+
+        print("Match " + bcolours.OKGREEN + repr(match) + bcolours.ENDC)
+        print("  normalised as " + bcolours.OKBLUE + normalised + bcolours.ENDC)
+        print("  scored: " + bcolours.FAIL + repr(result.score) + bcolours.ENDC)
+    else:
+        match1, match2 = result.matches
+        normalised1 = "|".join(flatten(match1))
+        normalised2 = "|".join(flatten(match2))
 
-def sortlist_cmp(x, y):
-    # Project out the score, from the match
-    x_score, x_match = x
-    y_score, y_match = y
-    return scoring_cmp(x_score, y_score)
+        print("Match " + bcolours.OKGREEN + repr(match1) + bcolours.ENDC)
+        print("      " + bcolours.OKGREEN + repr(match2) + bcolours.ENDC)
+        print("  normalised as " + bcolours.OKBLUE + normalised1 + bcolours.ENDC)
+        print("                " + bcolours.OKBLUE + normalised2 + bcolours.ENDC)
+        print("  scored: " + bcolours.FAIL + repr(result.score) + bcolours.ENDC)
 
 
-scorelist = [max(scorelist, key=cmp_to_key(sortlist_cmp))]
+def print_schedule(lines: Iterable[str], matches: Sequence[Sequence[str]]) -> None:
+    """
+    Print out every line of the original file, with the matches replaced by
+    those given.
+    """
+    cur_match_no = 0
+    for line in lines:
+        if len(line) > 0 and line[0] == helpers.COMMENT_CHAR:
+            print(line)
+            continue
 
+        if line:
+            print(helpers.SEPARATOR.join(matches[cur_match_no]))
+            cur_match_no += 1
+        else:
+            print(line)
 
-class bcolours:
-    HEADER = '\033[95m'
-    OKBLUE = '\033[94m'
-    OKGREEN = '\033[92m'
-    WARNING = '\033[93m'
-    FAIL = '\033[91m'
-    ENDC = '\033[0m'
 
+def _optimise(
+    masher: Masher,
+    executor: Optional[concurrent.futures.Executor],
+) -> None:
+    for sweep, improvements in enumerate(masher.optimise(executor), start=1):
+        print(
+            f"Sweep {sweep}: {len(improvements)} improvements, "
+            f"scored: {masher.facing_table.score()!r}",
+            file=sys.stderr,
+        )
+
+
+def main(
+    infile: Path,
+    matchno: Optional[int] = None,
+    last_matchno: Optional[int] = None,
+    auto_alter: bool = False,
+    multimatch: bool = False,
+    matches: int = 0,
+    closeness: int = 0,
+    game_size: int = DEFAULT_GAME_SIZE,
+    all_matches: bool = False,
+    workers: int = 1,
+    top: int = 1,
+) -> None:
+    if multimatch and (matches == 0 or closeness == 0):
+        print("Matches and closeness options required for doing multimatch calcs", file=sys.stderr)
+        sys.exit(1)
+
+    if all_matches and (matches == 0 or closeness == 0):
+        print("Matches and closeness options required for optimising all matches", file=sys.stderr)
+        sys.exit(1)
+
+    if all_matches and matchno is not None:
+        print("Can't specify a match number when optimising all matches", file=sys.stderr)
+        sys.exit(1)
+
+    lines = load_lines(infile)
+    masher = Masher(
+        parse_matches(lines),
+        multimatch=multimatch,
+        matches_per_round=matches,
+        closeness=closeness,
+        game_size=game_size,
+    )
+
+    if all_matches:
+        if workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                _optimise(masher, executor)
+        else:
+            _optimise(masher, None)
 
-if not args.auto_alter:
-    if not args.multimatch:
-        for score, (g1, g2) in scorelist:
-            plist = list(g1)
-            plist += list(g2)
-            normalised = "|".join(plist)
+        print_schedule(lines, masher.matches)
+        return
 
-            print("Match " + bcolours.OKGREEN + repr((g1, g2)) + bcolours.ENDC)
-            print("  normalised as " + bcolours.OKBLUE + normalised + bcolours.ENDC)
-            print("  scored: " + bcolours.FAIL + repr(score) + bcolours.ENDC)
-    else:
-        for score, (match1, match2) in scorelist:
-            m1g1, m1g2 = match1
-            m2g1, m2g2 = match2
-            plist = list(m1g1)
-            plist += list(m1g2)
-            normalised1 = "|".join(plist)
-            plist = list(m2g1)
-            plist += list(m2g2)
-            normalised2 = "|".join(plist)
-
-            print("Match " + bcolours.OKGREEN + repr(match1) + bcolours.ENDC)
-            print("      " + bcolours.OKGREEN + repr(match2) + bcolours.ENDC)
-            print("  normalised as " + bcolours.OKBLUE + normalised1 + bcolours.ENDC)
-            print("                " + bcolours.OKBLUE + normalised2 + bcolours.ENDC)
-            print("  scored: " + bcolours.FAIL + repr(score) + bcolours.ENDC)
-
-    sys.exit(0)
-
-# Auto alter is enabled: re-read the input file, printing out every line
-# except the desired match, replacing it with the optimal match found.
-
-cur_match_no = 0
-for line in lines:
-    if len(line) > 0 and line[0] == helpers.COMMENT_CHAR:
-        print(line)
-        continue
-
-    if cur_match_no == args.matchno:
-        # Replace it. Pick the optimal ordering, which is the last in the list
-        bestscore, bestmatch = scorelist[-1]
-
-        if not args.multimatch:
-            g1, g2 = bestmatch
-            plist = list(g1)
-            plist += list(g2)
-            print(helpers.SEPARATOR.join(plist))
-        else:
-            (g1, g2), (g3, g4) = bestmatch  # type: ignore[assignment]
-            plist = list(g1)
-            plist += list(g2)
-            print(helpers.SEPARATOR.join(plist))
-            plist = list(g3)
-            plist += list(g4)
-            print(helpers.SEPARATOR.join(plist))
-    elif args.multimatch and cur_match_no == args.matchno + 1:
-        pass  # already printed it
+    if matchno is None:
+        matchnos = range(len(masher.matches))
     else:
-        # Just print it
-        print(line)
-
-    cur_match_no += 1
+        matchnos = range(matchno, (matchno if last_matchno is None else last_matchno) + 1)
+
+    if multimatch and len(matchnos) == 1 and not masher.can_multimatch(matchnos[0]):
+        print("Can't multi-match schedule over round boundaries, skipping this one", file=sys.stderr)
+
+    results = masher.mash_range(matchnos, top)
+
+    if not auto_alter:
+        for result in itertools.chain.from_iterable(results):
+            print_result(result)
+        return
+
+    # Auto alter is enabled: print out every line of the input file, with the
+    # re-mashed matches replaced by the optimal arrangements found.
+    print_schedule(lines, masher.matches)
+
+
+def parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(
+        description="Identify teams that can be swapped between games inside matches",
+    )
+    ap.add_argument(
+        "infile",
+        type=Path,
+        help="Input schedule",
+    )
+    ap.add_argument(
+        "matchno",
+        type=int,
+        nargs='?',
+        help="Which match number to fiddle with (default: every match, in turn)",
+    )
+    ap.add_argument(
+        "--to",
+        dest='last_matchno',
+        type=int,
+        help=(
+            "Also fiddle with each match after `matchno` up to and including "
+            "this one, in turn, in the same run"
+        ),
+    )
+    ap.add_argument(
+        "--auto-alter",
+        action="store_true",
+        help="Print the schedule with specified match patched",
+    )
+    ap.add_argument(
+        "--multimatch",
+        action="store_true",
+        help="Consider swapping teams between this and the next match",
+    )
+    ap.add_argument(
+        "--matches",
+        type=int,
+        default=0,
+        help="Number of matches in each round",
+    )
+    ap.add_argument(
+        "--closeness",
+        type=int,
+        default=0,
+        help="Closeness criteria",
+    )
+    ap.add_argument(
+        "--game-size",
+        type=int,
+        default=DEFAULT_GAME_SIZE,
+        help="Number of teams in each game (default: %(default)s)",
+    )
+    ap.add_argument(
+        "--all",
+        dest='all_matches',
+        action="store_true",
+        help=(
+            "Repeatedly try to improve every match, and every pair of adjacent "
+            "matches within a round, until no improvement is found. Prints "
+            "the resulting schedule."
+        ),
+    )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help=(
+            "Number of processes to score candidates in when optimising all "
+            "matches (default: %(default)s)"
+        ),
+    )
+    ap.add_argument(
+        "--top",
+        type=int,
+        default=1,
+        help=(
+            "Number of alternative arrangements to print for each match, best "
+            "first. The best is the one used. (default: %(default)s)"
+        ),
+    )
+    return ap.parse_args()
+
+
+if __name__ == '__main__':
+    main(**parse_args().__dict__)
@@ -4,10 +4,12 @@ from __future__ import annotations
 
 import argparse
 import collections
+import dataclasses
 from typing import Counter
 from pathlib import Path
 
 import helpers
+from analysis import AnalysisContext
 
 
 def _sort_key(value: tuple[str, int]) -> tuple[int, helpers.HumanSortTuple]:
@@ -15,18 +17,33 @@ def _sort_key(value: tuple[str, int]) -> tuple[int, helpers.HumanSortTuple]:
     return -count, helpers.human_sort_key(entrant)
 
 
-def main(schedule_file: Path) -> None:
-    lines = helpers.load_lines(schedule_file)
+@dataclasses.dataclass(frozen=True)
+class MatchesPerTeamResult:
+    # (entrant, number of matches), most matches first
+    counts: list[tuple[str, int]]
 
+    def render(self) -> str:
+        return ''.join(
+            f"{entrant}: {count}\n"
+            for entrant, count in self.counts
+        )
+
+    def metrics(self) -> dict[str, object]:
+        return {'matches': dict(self.counts)}
+
+
+def analyse(context: AnalysisContext) -> MatchesPerTeamResult:
     counter: Counter[str] = collections.Counter()
 
-    for match in lines:
-        teams = match.split(helpers.SEPARATOR)
-        for team in teams:
-            counter[team] += 1
+    for teams in context.iter_schedule():
+        counter.update(teams)
+
+    return MatchesPerTeamResult(sorted(counter.items(), key=_sort_key))
+
 
-    for entrant, count in sorted(counter.items(), key=_sort_key):
-        print(f"{entrant}: {count}")
+def main(schedule_file: Path, use_mmap: bool = False) -> None:
+    result = analyse(AnalysisContext(schedule_file, use_mmap=use_mmap))
+    print(result.render(), end='')
 
 
 def parse_args() -> argparse.Namespace:
@@ -34,6 +51,12 @@ def parse_args() -> argparse.Namespace:
         "Prints the number of matches each team has, sorted by match count."
     ))
     parser.add_argument('schedule_file', type=Path, help="File to search and modify")
+    parser.add_argument(
+        '--mmap',
+        dest='use_mmap',
+        action='store_true',
+        help="Memory-map the schedule file rather than reading it",
+    )
     return parser.parse_args()
 
 
@@ -2,59 +2,214 @@
 
 from __future__ import annotations
 
+import io
 import argparse
 import collections
-from typing import DefaultDict
+import dataclasses
+from typing import Optional, NamedTuple, DefaultDict
 from pathlib import Path
+from collections.abc import Iterable, Iterator, Sequence
 
+import numpy as np
 import helpers
-
-
-def main(schedule_file: Path) -> None:
-    matches = []
-    lines = helpers.load_lines(schedule_file)
-
-    for line in lines:
-        players = line.split(helpers.SEPARATOR)
-        assert len(players) == 4, "Only matches of size 4 are currently supported"
-        matches.append(set(players))
-
-    match_enumeration = tuple(enumerate(matches))
-
-    # Size of overlap -> match numbers
-    overlaps: DefaultDict[int, list[tuple[int, int]]] = collections.defaultdict(list)
-
-    for idx, match in match_enumeration:
-        for other_idx, other_match in match_enumeration[idx + 1:]:
-            overlap = match & other_match
-
-            if len(overlap) <= 2:
-                continue
-
-            overlaps[len(overlap)].append((idx, other_idx))
-
-            if len(overlap) == 4:
+from analysis import TEAMS_PER_GAME, AnalysisContext
+
+# Matches which share at least this many teams are reported
+MIN_OVERLAP = 3
+
+
+class _Unit(NamedTuple):
+    """
+    A match, or a game within a match, whose teams are compared.
+    """
+    match_num: int
+    # None when comparing whole matches
+    game_num: Optional[int]
+    team_ids: frozenset[int]
+
+
+def _units(
+    schedule: helpers.InternedSchedule,
+    game_size: Optional[int],
+) -> list[_Unit]:
+    units = []
+    for match_num, match in enumerate(schedule):
+        if game_size is None:
+            games: Iterable[tuple[Optional[int], Sequence[int]]] = [(None, match)]
+        else:
+            games = (
+                (game_num, match[lower:lower + game_size])
+                for game_num, lower in enumerate(range(0, len(match), game_size))
+            )
+
+        for game_num, team_ids in games:
+            units.append(_Unit(match_num, game_num, frozenset(team_ids)))
+    return units
+
+
+@dataclasses.dataclass(frozen=True)
+class Overlap:
+    match_num: int
+    other_match_num: int
+    # The teams in each match (or game), sorted
+    teams: tuple[str, ...]
+    other_teams: tuple[str, ...]
+    size: int
+    # Set when comparing games rather than whole matches
+    game_num: Optional[int] = None
+    other_game_num: Optional[int] = None
+
+    @property
+    def identical(self) -> bool:
+        return self.teams == self.other_teams
+
+    def describe(self) -> tuple[str, str]:
+        if self.game_num is None or self.other_game_num is None:
+            return f"{self.match_num}", f"{self.other_match_num}"
+        return (
+            f"{self.match_num} game {self.game_num}",
+            f"{self.other_match_num} game {self.other_game_num}",
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class OverlapsResult:
+    overlaps: list[Overlap]
+
+    def sizes(self) -> dict[int, int]:
+        """
+        The number of overlaps of each size, in order of first occurrence.
+        """
+        sizes: DefaultDict[int, int] = collections.defaultdict(int)
+        for overlap in self.overlaps:
+            sizes[overlap.size] += 1
+        return dict(sizes)
+
+    def render(self) -> str:
+        out = io.StringIO()
+
+        for overlap in self.overlaps:
+            first, other = overlap.describe()
+            if overlap.identical:
                 print("Match {} is identical to match {}: both contain {}".format(
-                    idx,
-                    other_idx,
-                    ','.join(sorted(match)),
-                ))
-            elif len(overlap) == 3:
+                    first,
+                    other,
+                    ','.join(overlap.teams),
+                ), file=out)
+            else:
                 print("Match {} overlaps with match {}: {} vs {}".format(
-                    idx,
-                    other_idx,
-                    ','.join(sorted(match)),
-                    ','.join(sorted(other_match)),
-                ))
-
-    if not overlaps:
-        print("No overlaps")
-        return
-
-    print()
-    print("Overlap summary")
-    for size, overlapping_matches in overlaps.items():
-        print(f" Size {size}: {len(overlapping_matches)}")
+                    first,
+                    other,
+                    ','.join(overlap.teams),
+                    ','.join(overlap.other_teams),
+                ), file=out)
+
+        if not self.overlaps:
+            print("No overlaps", file=out)
+            return out.getvalue()
+
+        print(file=out)
+        print("Overlap summary", file=out)
+        for size, count in self.sizes().items():
+            print(f" Size {size}: {count}", file=out)
+
+        return out.getvalue()
+
+    def metrics(self) -> dict[str, object]:
+        overlaps: list[dict[str, object]] = []
+        for x in self.overlaps:
+            info: dict[str, object] = {
+                'matches': [x.match_num, x.other_match_num],
+                'size': x.size,
+            }
+            if x.game_num is not None:
+                info['games'] = [x.game_num, x.other_game_num]
+            overlaps.append(info)
+
+        return {
+            'sizes': {str(x): y for x, y in self.sizes().items()},
+            'overlaps': overlaps,
+        }
+
+
+def _overlapping_pairs(
+    units: Sequence[_Unit],
+    num_teams: int,
+    min_size: int,
+) -> Iterator[tuple[int, int, int]]:
+    """
+    Yield the pairs of units which share at least `min_size` teams, along with
+    how many teams they share.
+
+    Rather than comparing every pair of units, count how often each earlier
+    unit appears among the units each of a unit's teams are in. The cost thus
+    depends on how often teams meet, rather than on the size of the units or
+    of the overlaps being looked for.
+    """
+    # Map team id -> indices of the units it's in, in order
+    units_by_team: list[list[int]] = [[] for _ in range(num_teams)]
+    for idx, unit in enumerate(units):
+        for team_id in unit.team_ids:
+            units_by_team[team_id].append(idx)
+    team_units = [np.array(x, dtype=np.int64) for x in units_by_team]
+
+    # How many of each team's units have been reached so far
+    num_seen = [0] * num_teams
+    for idx, unit in enumerate(units):
+        earlier = [team_units[x][:num_seen[x]] for x in unit.team_ids]
+        for team_id in unit.team_ids:
+            num_seen[team_id] += 1
+
+        others, sizes = np.unique(np.concatenate(earlier), return_counts=True)
+        keep = sizes >= min_size
+        for other_idx, size in zip(others[keep].tolist(), sizes[keep].tolist()):
+            yield other_idx, idx, size
+
+
+def analyse(
+    context: AnalysisContext,
+    min_overlap: int = MIN_OVERLAP,
+    per_game: bool = False,
+    game_size: int = TEAMS_PER_GAME,
+) -> OverlapsResult:
+    if min_overlap < 1:
+        raise ValueError("Overlaps must be of at least one team")
+
+    schedule = context.interned
+    units = _units(schedule, game_size if per_game else None)
+
+    pairs = sorted(_overlapping_pairs(units, schedule.num_teams, min_overlap))
+
+    overlaps = []
+    for idx, other_idx, size in pairs:
+        unit = units[idx]
+        other = units[other_idx]
+        overlaps.append(Overlap(
+            unit.match_num,
+            other.match_num,
+            tuple(sorted(schedule.names(unit.team_ids))),
+            tuple(sorted(schedule.names(other.team_ids))),
+            size,
+            unit.game_num,
+            other.game_num,
+        ))
+
+    return OverlapsResult(overlaps)
+
+
+def main(
+    schedule_file: Path,
+    min_overlap: int = MIN_OVERLAP,
+    per_game: bool = False,
+    game_size: int = TEAMS_PER_GAME,
+) -> None:
+    result = analyse(
+        AnalysisContext(schedule_file),
+        min_overlap=min_overlap,
+        per_game=per_game,
+        game_size=game_size,
+    )
+    print(result.render(), end='')
 
 
 def parse_args() -> argparse.Namespace:
@@ -62,6 +217,23 @@ def parse_args() -> argparse.Namespace:
         "Highlights matches whose players overlap substantially with other matches",
     )
     parser.add_argument('schedule_file', help='schedule to examine')
+    parser.add_argument(
+        '--min-overlap',
+        type=int,
+        default=MIN_OVERLAP,
+        help="Number of shared teams at which to report an overlap (default: %(default)s)",
+    )
+    parser.add_argument(
+        '--per-game',
+        action='store_true',
+        help="Compare the individual games within matches rather than whole matches",
+    )
+    parser.add_argument(
+        '--game-size',
+        type=int,
+        default=TEAMS_PER_GAME,
+        help="Number of teams in each game, when comparing games (default: %(default)s)",
+    )
     return parser.parse_args()
 
 
@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+
+"""
+Interactive editing of a schedule, reporting how each edit changes the
+measures used by the checks.
+
+A `ScheduleSession` loads a schedule once and then keeps the matches per team
+(matches_per_team), minimum gaps (close), facings (faced), corner counts
+(corners) and overlaps (overlaps) up to date as matches are replaced, swapped
+or moved, only revisiting the teams, pairs and matches which an edit touches.
+"""
+
+from __future__ import annotations
+
+import io
+import cmd
+import sys
+import argparse
+import itertools
+import collections
+import dataclasses
+from typing import Tuple, TypeVar, Optional, DefaultDict
+from pathlib import Path
+from collections.abc import Mapping, Iterable, Iterator, Sequence
+
+import swap
+import helpers
+from corners import _DEFAULT_NUM_CORNERS
+from helpers import Team, Schedule
+from analysis import TEAMS_PER_GAME
+from overlaps import MIN_OVERLAP
+
+K = TypeVar('K')
+V = TypeVar('V')
+
+Match = Tuple[Team, ...]
+Pair = Tuple[Team, Team]
+
+
+def _pair(team: Team, other: Team) -> Pair:
+    return (team, other) if team < other else (other, team)
+
+
+def _pair_indices(idx: int, other_idx: int) -> tuple[int, int]:
+    return (idx, other_idx) if idx < other_idx else (other_idx, idx)
+
+
+def _decrement(counter: collections.Counter[K], key: K) -> None:
+    count = counter[key] - 1
+    if count:
+        counter[key] = count
+    else:
+        del counter[key]
+
+
+def _diff(before: Mapping[K, V], after: Mapping[K, V]) -> dict[K, tuple[V, V]]:
+    return {
+        key: (value, after[key])
+        for key, value in before.items()
+        if value != after[key]
+    }
+
+
+def _diff_sparse(
+    before: Mapping[K, V],
+    after: Mapping[K, V],
+) -> dict[K, tuple[Optional[V], Optional[V]]]:
+    return {
+        key: (before.get(key), after.get(key))
+        for key in before.keys() | after.keys()
+        if before.get(key) != after.get(key)
+    }
+
+
+@dataclasses.dataclass(frozen=True)
+class _Snapshot:
+    matches: dict[Team, int]
+    min_gaps: dict[Team, Optional[int]]
+    facings: dict[Pair, int]
+    corners: dict[tuple[Team, int], int]
+    overlaps: dict[tuple[int, int], int]
+
+
+@dataclasses.dataclass(frozen=True)
+class MetricsDelta:
+    """
+    The changes to each measure made by an edit, as (before, after) pairs.
+    Overlaps which are absent on one side are smaller than the minimum.
+    """
+
+    matches: dict[Team, tuple[int, int]]
+    min_gaps: dict[Team, tuple[Optional[int], Optional[int]]]
+    facings: dict[Pair, tuple[int, int]]
+    corners: dict[tuple[Team, int], tuple[int, int]]
+    overlaps: dict[tuple[int, int], tuple[Optional[int], Optional[int]]]
+
+    @classmethod
+    def between(cls, before: _Snapshot, after: _Snapshot) -> MetricsDelta:
+        return cls(
+            matches=_diff(before.matches, after.matches),
+            min_gaps=_diff(before.min_gaps, after.min_gaps),
+            facings=_diff(before.facings, after.facings),
+            corners=_diff(before.corners, after.corners),
+            overlaps=_diff_sparse(before.overlaps, after.overlaps),
+        )
+
+    def __bool__(self) -> bool:
+        return any((self.matches, self.min_gaps, self.facings, self.corners, self.overlaps))
+
+    def render(self) -> str:
+        if not self:
+            return "No changes\n"
+
+        def describe(value: Optional[int]) -> str:
+            return 'none' if value is None else str(value)
+
+        sections = (
+            ("Matches per team", dict(sorted(
+                self.matches.items(),
+                key=lambda x: helpers.human_sort_key(x[0]),
+            ))),
+            ("Minimum gaps", dict(sorted(
+                self.min_gaps.items(),
+                key=lambda x: helpers.human_sort_key(x[0]),
+            ))),
+            ("Facings", {
+                " v ".join(pair): change
+                for pair, change in sorted(
+                    ((tuple(sorted(x, key=helpers.human_sort_key)), y) for x, y in self.facings.items()),
+                    key=lambda x: tuple(map(helpers.human_sort_key, x[0])),
+                )
+            }),
+            ("Corners", {
+                f"{team} in {corner}": change
+                for (team, corner), change in sorted(
+                    self.corners.items(),
+                    key=lambda x: (helpers.human_sort_key(x[0][0]), x[0][1]),
+                )
+            }),
+            ("Overlaps", {
+                f"{match_num} & {other_match_num}": change
+                for (match_num, other_match_num), change in sorted(self.overlaps.items())
+            }),
+        )
+
+        out = io.StringIO()
+        for title, changes in sections:
+            if not changes:
+                continue
+            print(f"{title}:", file=out)
+            for label, (old, new) in changes.items():
+                print(f"  {label}: {describe(old)} -> {describe(new)}", file=out)
+        return out.getvalue()
+
+
+class ScheduleSession(helpers.GapIndex):
+    """
+    A schedule which can be edited in place while keeping the measures which
+    the checks report up to date.
+
+    Facings are counted within games of `TEAMS_PER_GAME` teams and corners are
+    positions within each group of `num_corners` teams, as in the respective
+    checks. Every edit returns a `MetricsDelta` and can be undone.
+    """
+
+    def __init__(
+        self,
+        schedule: Schedule,
+        *,
+        num_corners: int = _DEFAULT_NUM_CORNERS,
+        min_overlap: int = MIN_OVERLAP,
+    ) -> None:
+        super().__init__()
+        self.num_corners = num_corners
+        self.min_overlap = min_overlap
+
+        self.schedule: list[Match] = [tuple(x) for x in schedule]
+        # Map TLA -> gap -> count
+        self.gaps: DefaultDict[Team, collections.Counter[int]]
+        self.gaps = collections.defaultdict(collections.Counter)
+        # Map pair of TLAs -> number of games they're in together
+        self.facings: collections.Counter[Pair] = collections.Counter()
+        # Map (TLA, corner) -> count
+        self.corners: collections.Counter[tuple[Team, int]] = collections.Counter()
+        # Map match -> other match -> number of shared teams, only for pairs
+        # of matches which share at least `min_overlap` teams
+        self.overlaps: DefaultDict[int, dict[int, int]] = collections.defaultdict(dict)
+
+        self._history: list[dict[int, Match]] = []
+
+        for idx, teams in enumerate(self.schedule):
+            self._add_match(idx, teams)
+        for idx in range(len(self.schedule)):
+            self._add_overlaps(idx)
+
+    @classmethod
+    def load(
+        cls,
+        schedule_file: Path,
+        *,
+        num_corners: int = _DEFAULT_NUM_CORNERS,
+        min_overlap: int = MIN_OVERLAP,
+    ) -> ScheduleSession:
+        return cls(
+            helpers.load_schedule(schedule_file),
+            num_corners=num_corners,
+            min_overlap=min_overlap,
+        )
+
+    def num_matches(self, tla: Team) -> int:
+        return len(self.appearances.get(tla, ()))
+
+    def min_gap(self, tla: Team) -> Optional[int]:
+        gaps = self.gaps.get(tla)
+        return min(gaps) if gaps else None
+
+    def _games(self, teams: Match) -> Iterator[Match]:
+        for lower in range(0, len(teams), TEAMS_PER_GAME):
+            yield teams[lower:lower + TEAMS_PER_GAME]
+
+    def _pairs(self, teams: Match) -> Iterator[Pair]:
+        for game in self._games(teams):
+            for tla, other in itertools.combinations(game, 2):
+                # Teams don't face themselves
+                if tla != other:
+                    yield _pair(tla, other)
+
+    def _corners(self, teams: Match) -> Iterator[tuple[Team, int]]:
+        for position, tla in enumerate(teams):
+            yield tla, position % self.num_corners
+
+    def _add_gap(self, tla: Team, gap: int) -> None:
+        self.gaps[tla][gap] += 1
+
+    def _remove_gap(self, tla: Team, gap: int) -> None:
+        _decrement(self.gaps[tla], gap)
+
+    def _add_match(self, idx: int, teams: Match) -> None:
+        for tla in teams:
+            self._insert(tla, idx)
+        self.facings.update(self._pairs(teams))
+        self.corners.update(self._corners(teams))
+
+    def _remove_match(self, idx: int, teams: Match) -> None:
+        for tla in teams:
+            self._remove(tla, idx)
+        for pair in self._pairs(teams):
+            _decrement(self.facings, pair)
+        for corner in self._corners(teams):
+            _decrement(self.corners, corner)
+
+    def _add_overlaps(self, idx: int) -> None:
+        # Count the teams shared with each other match via the matches each of
+        # this match's teams appear in, rather than comparing every match.
+        shared: collections.Counter[int] = collections.Counter()
+        for tla in set(self.schedule[idx]):
+            # A team could appear twice in a match
+            shared.update(set(self.appearances[tla]))
+        del shared[idx]
+
+        for other_idx, size in shared.items():
+            if size >= self.min_overlap:
+                self.overlaps[idx][other_idx] = size
+                self.overlaps[other_idx][idx] = size
+
+    def _remove_overlaps(self, idx: int) -> None:
+        for other_idx in self.overlaps.pop(idx, {}):
+            del self.overlaps[other_idx][idx]
+
+    def _snapshot(
+        self,
+        indices: Iterable[int],
+        teams: Iterable[Team],
+        pairs: Iterable[Pair],
+        corners: Iterable[tuple[Team, int]],
+    ) -> _Snapshot:
+        teams = tuple(teams)
+        return _Snapshot(
+            matches={x: self.num_matches(x) for x in teams},
+            min_gaps={x: self.min_gap(x) for x in teams},
+            facings={x: self.facings[x] for x in pairs},
+            corners={x: self.corners[x] for x in corners},
+            overlaps={
+                _pair_indices(idx, other_idx): size
+                for idx in indices
+                for other_idx, size in self.overlaps.get(idx, {}).items()
+            },
+        )
+
+    def _check_index(self, idx: int) -> None:
+        if not 0 <= idx < len(self.schedule):
+            raise IndexError(f"No match {idx} in a schedule of {len(self.schedule)} matches")
+
+    def _apply(self, changes: Mapping[int, Match]) -> MetricsDelta:
+        affected = [self.schedule[idx] for idx in changes] + list(changes.values())
+        teams = set(itertools.chain.from_iterable(affected))
+        pairs = {x for teams in affected for x in self._pairs(teams)}
+        corners = {x for teams in affected for x in self._corners(teams)}
+
+        before = self._snapshot(changes, teams, pairs, corners)
+
+        # Overlaps are counted from the appearances, so must only be found
+        # again once all the matches have been changed.
+        for idx in changes:
+            self._remove_overlaps(idx)
+        for idx, teams_this_match in changes.items():
+            self._remove_match(idx, self.schedule[idx])
+            self.schedule[idx] = teams_this_match
+            self._add_match(idx, teams_this_match)
+        for idx in changes:
+            self._add_overlaps(idx)
+
+        after = self._snapshot(changes, teams, pairs, corners)
+        return MetricsDelta.between(before, after)
+
+    def apply(self, changes: Mapping[int, Sequence[Team]]) -> MetricsDelta:
+        """
+        Replace the matches at the given (zero-based) indices with the given
+        matches, returning how the measures changed.
+        """
+        for idx in changes:
+            self._check_index(idx)
+
+        undo = {idx: self.schedule[idx] for idx in changes}
+        delta = self._apply({idx: tuple(teams) for idx, teams in changes.items()})
+        self._history.append(undo)
+        return delta
+
+    def replace(self, idx: int, teams: Sequence[Team]) -> MetricsDelta:
+        return self.apply({idx: teams})
+
+    def substitute(self, idx: int, find: Team, replace: Team) -> MetricsDelta:
+        """
+        Replace one team with another within a match.
+        """
+        self._check_index(idx)
+        teams = self.schedule[idx]
+        if find not in teams:
+            raise ValueError(f"{find} is not in match {idx}")
+        return self.replace(idx, [replace if x == find else x for x in teams])
+
+    def swap(self, idx: int, other_idx: int) -> MetricsDelta:
+        self._check_index(idx)
+        self._check_index(other_idx)
+        return self.apply({idx: self.schedule[other_idx], other_idx: self.schedule[idx]})
+
+    def move(self, idx: int, position: int) -> MetricsDelta:
+        """
+        Move a match to a new position, shifting the matches in between.
+        """
+        self._check_index(idx)
+        self._check_index(position)
+        order = list(range(len(self.schedule)))
+        order.insert(position, order.pop(idx))
+        return self.apply({
+            new_idx: self.schedule[old_idx]
+            for new_idx, old_idx in enumerate(order)
+            if new_idx != old_idx
+        })
+
+    def undo(self) -> MetricsDelta:
+        """
+        Undo the most recent edit, returning how the measures changed.
+        """
+        if not self._history:
+            raise ValueError("Nothing to undo")
+        return self._apply(self._history.pop())
+
+
+class SessionShell(cmd.Cmd):
+    intro = "Edit the schedule one command at a time. Type help or ? to list commands."
+    prompt = '> '
+
+    def __init__(self, session: ScheduleSession, schedule_file: Path) -> None:
+        super().__init__()
+        self.session = session
+        self.schedule_file = schedule_file
+        # The original file, so that its comments and layout are kept when
+        # the schedule is written
+        self.source = swap.ScheduleFile.load(schedule_file)
+        if not sys.stdin.isatty():
+            self.intro = ''
+            self.prompt = ''
+
+    def onecmd(self, line: str) -> bool:
+        try:
+            return super().onecmd(line)
+        except (ValueError, IndexError) as e:
+            print(f"Error: {e}")
+            return False
+
+    def emptyline(self) -> bool:
+        # Don't repeat the last edit
+        return False
+
+    def _report(self, delta: MetricsDelta) -> None:
+        print(delta.render(), end='')
+
+    def do_replace(self, arg: str) -> None:
+        "replace MATCH TEAMS: replace a match with the given pipe separated teams"
+        idx, teams = arg.split(maxsplit=1)
+        self._report(self.session.replace(int(idx), helpers.parse_match(teams)))
+
+    def do_sub(self, arg: str) -> None:
+        "sub MATCH FIND REPLACE: replace one team with another in a match"
+        idx, find, replace = arg.split()
+        self._report(self.session.substitute(int(idx), Team(find), Team(replace)))
+
+    def do_swap(self, arg: str) -> None:
+        "swap MATCH OTHER: swap two matches"
+        idx, other_idx = arg.split()
+        self._report(self.session.swap(int(idx), int(other_idx)))
+
+    def do_move(self, arg: str) -> None:
+        "move MATCH POSITION: move a match, shifting those in between"
+        idx, position = arg.split()
+        self._report(self.session.move(int(idx), int(position)))
+
+    def do_undo(self, arg: str) -> None:
+        "undo: undo the last edit"
+        self._report(self.session.undo())
+
+    def do_show(self, arg: str) -> None:
+        "show [MATCH...]: print the given matches, or the whole schedule"
+        schedule = self.session.schedule
+        indices = [int(x) for x in arg.split()] or range(len(schedule))
+        for idx in indices:
+            print(f"{idx}: {helpers.SEPARATOR.join(schedule[idx])}")
+
+    def do_write(self, arg: str) -> None:
+        "write [FILE]: write the schedule, by default over the original file"
+        path = Path(arg.strip()) if arg.strip() else self.schedule_file
+        source = self.source
+        if len(source.matches) != len(self.session.schedule):
+            raise ValueError(f"Can't match the schedule to the lines of {self.schedule_file}")
+
+        for line_num, teams in zip(list(source.matches), self.session.schedule):
+            stripped = [x.strip() for x in teams]
+            if stripped != source.matches[line_num]:
+                source.set_match(line_num, stripped)
+        source.write(path)
+        print(f"Wrote {len(self.session.schedule)} matches to {path}")
+
+    def do_quit(self, arg: str) -> bool:
+        "quit: stop editing, without writing the schedule"
+        return True
+
+    def do_EOF(self, arg: str) -> bool:
+        return True
+
+
+def main(
+    schedule_file: Path,
+    num_corners: int = _DEFAULT_NUM_CORNERS,
+    min_overlap: int = MIN_OVERLAP,
+) -> None:
+    session = ScheduleSession.load(
+        schedule_file,
+        num_corners=num_corners,
+        min_overlap=min_overlap,
+    )
+    SessionShell(session, schedule_file).cmdloop()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=(
+        "Interactively edit a schedule, reporting how each edit changes the "
+        "matches per team, minimum gaps, facings, corners and overlaps. "
+        "Matches are numbered from zero. Comments and blank lines are kept "
+        "when writing the schedule."
+    ))
+    parser.add_argument('schedule_file', type=Path, help="schedule to edit")
+    parser.add_argument(
+        '--num-corners',
+        type=int,
+        default=_DEFAULT_NUM_CORNERS,
+        help="The number of zones in the arena (default: %(default)s).",
+    )
+    parser.add_argument(
+        '--min-overlap',
+        type=int,
+        default=MIN_OVERLAP,
+        help="Number of shared teams which make two matches overlap (default: %(default)s).",
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(**parse_args().__dict__)
@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 
-import io
+import json
+import time
 import argparse
 import textwrap
-import contextlib
+import dataclasses
+import tracemalloc
+import concurrent.futures
+from typing import Callable, Iterator, Optional
 from pathlib import Path
 
 import close
@@ -12,14 +16,15 @@ import corners
 import feasible
 import overlaps
 import matches_per_team
-
-CHECKS = [
-    ("Closeness", close),
-    ("Facings", faced),
-    ("Corner allocations", corners),
-    ("Matches per team", matches_per_team),
-    ("Overlaps", overlaps),
-    ("Feasibility", feasible),
+from analysis import CheckResult, AnalysisContext
+
+CHECKS: list[tuple[str, Callable[[AnalysisContext], CheckResult]]] = [
+    ("Closeness", close.analyse),
+    ("Facings", faced.analyse),
+    ("Corner allocations", corners.analyse),
+    ("Matches per team", matches_per_team.analyse),
+    ("Overlaps", overlaps.analyse),
+    ("Feasibility", feasible.analyse),
 ]
 
 
@@ -50,15 +55,105 @@ FORMATS = {
     'github': github_collapsed_details_format,
 }
 
+JSON_FORMAT = 'json'
+
+
+@dataclasses.dataclass(frozen=True)
+class CheckRun:
+    name: str
+    result: CheckResult
+    # Seconds
+    wall_time: float
+    # Bytes allocated by Python at peak during the check, above what was
+    # already allocated when it started, if measured
+    peak_memory: Optional[int]
+
+    def metrics(self) -> dict[str, object]:
+        return {
+            'name': self.name,
+            'wall_time': self.wall_time,
+            'peak_memory': self.peak_memory,
+            'metrics': self.result.metrics(),
+        }
+
+
+def _measure(
+    name: str,
+    analyse: Callable[[AnalysisContext], CheckResult],
+    context: AnalysisContext,
+    measure_memory: bool,
+) -> CheckRun:
+    if measure_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+
+    start = time.perf_counter()
+    result = analyse(context)
+    wall_time = time.perf_counter() - start
+
+    peak_memory = None
+    if measure_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        peak_memory = peak - baseline
+
+    return CheckRun(name, result, wall_time, peak_memory)
+
+
+def _run_check(
+    name: str,
+    analyse: Callable[[AnalysisContext], CheckResult],
+    schedule_file: Path,
+    measure_memory: bool,
+) -> CheckRun:
+    return _measure(name, analyse, AnalysisContext(schedule_file), measure_memory)
+
+
+def run_checks(
+    schedule_file: Path,
+    jobs: int = 1,
+    measure_memory: bool = False,
+) -> Iterator[CheckRun]:
+    """
+    Run each of the checks, yielding their results in the order of `CHECKS`
+    as soon as each is available.
+
+    Measuring memory use slows the checks down noticeably, so is optional.
+    When the checks share a context the time and memory spent parsing the
+    schedule count towards the first check which needs it.
+    """
+    if jobs <= 1:
+        # Shared between the checks so that the schedule is only parsed once
+        context = AnalysisContext(schedule_file, stream=False)
+        for name, analyse in CHECKS:
+            yield _measure(name, analyse, context, measure_memory)
+        return
+
+    # Each worker process parses the schedule for itself; the parsed schedule
+    # cache makes that cheap for all but the first.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(_run_check, name, analyse, schedule_file, measure_memory)
+            for name, analyse in CHECKS
+        ]
+        for future in futures:
+            yield future.result()
+
+
+def main(schedule_file: Path, formatter_slug: str, jobs: int = 1) -> None:
+    if formatter_slug == JSON_FORMAT:
+        runs = run_checks(schedule_file, jobs, measure_memory=True)
+        print(json.dumps({
+            'schedule_file': str(schedule_file),
+            'checks': [x.metrics() for x in runs],
+        }, indent=2))
+        return
 
-def main(schedule_file: Path, formatter_slug: str) -> None:
     formatter = FORMATS[formatter_slug]
 
-    for name, module in CHECKS:
-        with contextlib.redirect_stdout(io.StringIO()) as stdout:
-            module.main(schedule_file)
-
-        print(formatter(name, stdout.getvalue()))
+    for run in run_checks(schedule_file, jobs):
+        print(formatter(run.name, run.result.render()), flush=True)
 
 
 def parse_args() -> argparse.Namespace:
@@ -69,9 +164,22 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         '--format',
         dest='formatter_slug',
-        choices=FORMATS.keys(),
+        choices=(*FORMATS.keys(), JSON_FORMAT),
         default='markdown',
-        help="Output format (default: %(default)s)",
+        help=(
+            "Output format. The 'json' format contains metrics from each check, "
+            "along with how long it took and its peak memory use. "
+            "(default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=1,
+        help=(
+            "Number of checks to run concurrently, each in its own process "
+            "(default: %(default)s)"
+        ),
     )
     return parser.parse_args()
 
@@ -1,42 +1,205 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
+import os
+import sys
+import bisect
+import shutil
 import argparse
+import collections
+from typing import DefaultDict
 from pathlib import Path
+from collections.abc import Sequence
 
 import helpers
 
 
-def main(schedule_file: Path, find: str, replace: str) -> None:
-    lines = schedule_file.read_text().splitlines(keepends=False)
+def _split_whitespace(text: str) -> tuple[str, str, str]:
+    value = text.strip()
+    if not value:
+        return text, '', ''
+    start = text.index(value)
+    return text[:start], value, text[start + len(value):]
+
+
+class ScheduleFile:
+    """
+    The lines of a schedule file along with an index of the matches each team
+    is in, so that many teams can be replaced within matches without scanning
+    the whole file each time. Lines which aren't changed, including comments,
+    are written back untouched.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.lines = text.splitlines(keepends=True)
+        # Map line number -> teams in the match on that line
+        self.matches: dict[int, list[str]] = {}
+        # Map team -> line numbers of the matches it's in, sorted
+        self.team_matches: DefaultDict[str, list[int]] = collections.defaultdict(list)
+
+        for line_num, line in enumerate(self.lines):
+            content = line.split(helpers.COMMENT_CHAR, 1)[0]
+            if not content.strip():
+                continue
+
+            teams = [x.strip() for x in content.split(helpers.SEPARATOR)]
+            self.matches[line_num] = teams
+            for team in dict.fromkeys(teams):
+                self.team_matches[team].append(line_num)
+
+        self.changed: set[int] = set()
+
+    @classmethod
+    def load(cls, path: Path) -> ScheduleFile:
+        return cls(path.read_text())
+
+    def replace(self, find: str, replace: str) -> int:
+        """
+        Replace the first appearance of `find` in a match which doesn't already
+        contain `replace`, returning the line number of that match.
+        """
+        for line_num in self.team_matches.get(find, ()):
+            teams = self.matches[line_num]
+            if replace not in teams:
+                break
+        else:
+            raise ValueError(f"No match contains {find} but not {replace}")
+
+        teams[teams.index(find)] = replace
+
+        if find not in teams:
+            self.team_matches[find].remove(line_num)
+        bisect.insort(self.team_matches[replace], line_num)
+        self.changed.add(line_num)
+
+        return line_num
 
-    find = find.upper()
-    replace = replace.upper()
+    def set_match(self, line_num: int, teams: Sequence[str]) -> None:
+        """
+        Replace the teams in the match on the given line.
+        """
+        for team in dict.fromkeys(self.matches[line_num]):
+            self.team_matches[team].remove(line_num)
 
-    for i, line in enumerate(lines):
-        parts = line.strip().split(helpers.SEPARATOR)
+        self.matches[line_num] = list(teams)
+        for team in dict.fromkeys(teams):
+            bisect.insort(self.team_matches[team], line_num)
+        self.changed.add(line_num)
 
-        if find in parts and replace not in parts:
-            print(parts)
-            idx = parts.index(find)
-            parts[idx] = replace
-            print(parts)
+    def _render(self, line_num: int) -> str:
+        line = self.lines[line_num]
+        body = line.rstrip('\r\n')
+        content, comment_char, comment = body.partition(helpers.COMMENT_CHAR)
+        teams = self.matches[line_num]
 
-            line = helpers.SEPARATOR.join(parts)
-            lines[i] = line
-            break
+        existing = content.split(helpers.SEPARATOR)
+        if len(existing) == len(teams):
+            parts = []
+            for part, team in zip(existing, teams):
+                # Keep any whitespace around each team
+                before, _, after = _split_whitespace(part)
+                parts.append(before + team + after)
+            content = helpers.SEPARATOR.join(parts)
+        else:
+            # Only the whitespace before any comment can be kept
+            content = helpers.SEPARATOR.join(teams) + content[len(content.rstrip()):]
 
-    schedule_file.write_text('\n'.join(lines))
+        return content + comment_char + comment + line[len(body):]
+
+    def text(self) -> str:
+        return ''.join(
+            self._render(line_num) if line_num in self.changed else line
+            for line_num, line in enumerate(self.lines)
+        )
+
+    def write(self, path: Path) -> None:
+        """
+        Atomically write the schedule to the given path.
+        """
+        temp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+        try:
+            temp_path.write_text(self.text())
+            if path.exists():
+                shutil.copymode(path, temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+
+def load_plan(plan_file: Path) -> list[tuple[str, str]]:
+    """
+    Load a plan of swaps, one find/replace pair per line separated by
+    whitespace. Comments and empty lines are ignored as for schedules.
+    """
+    plan = []
+    for line in helpers.iter_lines(plan_file):
+        try:
+            find, replace = line.split()
+        except ValueError:
+            raise ValueError(f"Invalid plan entry {line!r}, expected 'FIND REPLACE'") from None
+        plan.append((find.upper(), replace.upper()))
+    return plan
+
+
+def main(
+    schedule_file: Path,
+    find: str | None = None,
+    replace: str | None = None,
+    plan_file: Path | None = None,
+) -> None:
+    if plan_file is not None:
+        plan = load_plan(plan_file)
+    else:
+        assert find is not None and replace is not None
+        plan = [(find.upper(), replace.upper())]
+
+    schedule = ScheduleFile.load(schedule_file)
+
+    changes = []
+    for old, new in plan:
+        try:
+            line_num = schedule.replace(old, new)
+        except ValueError as e:
+            # Leave the schedule untouched if any of the swaps can't be made
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        changes.append((line_num, old, new))
+
+    schedule.write(schedule_file)
+
+    for line_num, old, new in changes:
+        print(f"Line {line_num + 1}: {old} -> {new}")
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description=(
-        "Searches for a match that contains the first entrant, but not the second"
-        "and replaces the first for the second in that match."
+        "Searches for a match that contains the first entrant, but not the second "
+        "and replaces the first for the second in that match. With a plan file, "
+        "makes many such swaps in turn, writing the schedule once all have been "
+        "made."
     ))
     parser.add_argument('schedule_file', type=Path, help="File to search and modify")
-    parser.add_argument('find', help="Entrant to search for")
-    parser.add_argument('replace', help="Entrant to replace with")
-    return parser.parse_args()
+    parser.add_argument('find', nargs='?', help="Entrant to search for")
+    parser.add_argument('replace', nargs='?', help="Entrant to replace with")
+    parser.add_argument(
+        '--plan',
+        dest='plan_file',
+        type=Path,
+        help=(
+            "File of swaps to make, one per line as the entrant to search for and "
+            "the entrant to replace it with, separated by whitespace"
+        ),
+    )
+    args = parser.parse_args()
+
+    if args.plan_file is None and (args.find is None or args.replace is None):
+        parser.error("Either both entrants or a plan file are required")
+    if args.plan_file is not None and args.find is not None:
+        parser.error("Entrants can't be given along with a plan file")
+
+    return args
 
 
 if __name__ == '__main__':
@@ -21,6 +21,7 @@ setup(
     packages=['checks'],
 
     install_requires=[
+        'numpy',
         'tqdm',
     ],
 